@@ -0,0 +1,127 @@
+import json
+import threading
+import time
+
+from django.core.cache import cache
+from django.http import Http404, HttpResponse, HttpResponseNotModified
+
+from api.serializers import TagSerializer
+from recipes.models import Ingredient, Tag
+
+VERSION_KEY = 'catalog_version:{}'
+
+
+def get_version(name):
+    """Текущая версия набора данных name (ingredients, tags ...)."""
+    key = VERSION_KEY.format(name)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(name):
+    """Сдвигает версию набора данных, сбрасывая все построенные по нему
+    кэши и индексы."""
+    key = VERSION_KEY.format(name)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        return cache.get(key)
+
+
+def to_json_bytes(data):
+    return json.dumps(
+        data, ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+
+
+class CatalogSnapshot:
+    """Сериализованный снимок справочника (теги, ингредиенты с единицами
+    измерения) определённой версии: готовые байты списка и каждой записи.
+    """
+
+    def __init__(self, name, version, items):
+        self.name = name
+        self.version = version
+        self.etag = f'"{name}-{version}"'
+        self.items = items
+        self.list_body = to_json_bytes(items)
+        self.detail_bodies = {
+            item['id']: to_json_bytes(item) for item in items
+        }
+
+    def detail_body(self, pk):
+        return self.detail_bodies.get(pk)
+
+
+def build_tags():
+    return TagSerializer(Tag.objects.all(), many=True).data
+
+
+def build_ingredients():
+    return [
+        {'id': pk, 'name': name, 'measurement_unit': unit}
+        for pk, name, unit in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit__name'
+        )
+    ]
+
+
+CATALOG_BUILDERS = {
+    'tags': build_tags,
+    'ingredients': build_ingredients,
+}
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_mapped_catalog():
+    from api.snapshot import snapshot_reader
+
+    return snapshot_reader.get()
+
+
+def get_catalog(name):
+    """Снимок справочника name, перестраивается при смене его версии.
+    При совпадении версии обращений к БД нет.
+
+    Если задан CATALOG_SNAPSHOT_PATH и опубликованный файл актуален,
+    используется общий для воркеров снимок из api.snapshot.
+    """
+    version = get_version(name)
+    mapped = get_mapped_catalog()
+    if mapped is not None and mapped.versions[name] == version:
+        return mapped.section(name)
+
+    snapshot = _catalogs.get(name)
+    if snapshot is not None and snapshot.version == version:
+        return snapshot
+    with _catalogs_lock:
+        snapshot = _catalogs.get(name)
+        if snapshot is None or snapshot.version != version:
+            snapshot = CatalogSnapshot(
+                name, version, CATALOG_BUILDERS[name]()
+            )
+            _catalogs[name] = snapshot
+    return snapshot
+
+
+def catalog_response(request, name, pk=None):
+    """Ответ из снимка справочника с ETag; 304 при совпадении
+    If-None-Match."""
+    snapshot = get_catalog(name)
+    if pk is None:
+        body = snapshot.list_body
+    else:
+        body = snapshot.detail_body(pk)
+        if body is None:
+            raise Http404
+    if snapshot.etag in request.headers.get('If-None-Match', ''):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(body, content_type='application/json')
+    response['ETag'] = snapshot.etag
+    return response
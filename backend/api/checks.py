@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+from api.report import REPORT_BACKENDS
+
+
+@register()
+def check_report_backend(app_configs, **kwargs):
+    """SHOPPING_LIST_REPORT_BACKEND проверяется при запуске, а не при
+    первой выгрузке списка покупок."""
+    if settings.SHOPPING_LIST_REPORT_BACKEND in REPORT_BACKENDS:
+        return []
+    return [
+        Error(
+            'Неизвестный движок отчёта'
+            f' {settings.SHOPPING_LIST_REPORT_BACKEND!r}',
+            hint=f'Доступны: {", ".join(REPORT_BACKENDS)}',
+            obj='SHOPPING_LIST_REPORT_BACKEND',
+            id='api.E001',
+        )
+    ]
@@ -0,0 +1,72 @@
+import hashlib
+import time
+from math import floor
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from api import metrics
+from api.recipe_sets import get_viewer_stamp
+
+
+def get_recipes_etag(recipes, context, envelope=None):
+    """ETag страницы рецептов: id, pub_date и modified каждого рецепта,
+    флаги пользователя (избранное, корзина, подписка на автора) и
+    служебные поля ответа пагинатора (count, next, previous)."""
+    favorites = context.get('favorites', ())
+    shopping_cart = context.get('shopping_cart', ())
+    following = context.get('following', ())
+    state = [
+        (
+            recipe.id,
+            recipe.pub_date.timestamp(),
+            recipe.modified.timestamp(),
+            recipe.id in favorites,
+            recipe.id in shopping_cart,
+            recipe.author_id in following,
+        )
+        for recipe in recipes
+    ]
+    digest = hashlib.md5(repr((state, envelope)).encode()).hexdigest()
+    return quote_etag(digest)
+
+
+def get_last_modified(request, recipe):
+    """Last-Modified рецепта с учётом изменений флагов пользователя.
+
+    Время округляется вниз до секунды и отдаётся только после того, как
+    эта секунда прошла: иначе второе изменение в ту же секунду дало бы
+    тот же Last-Modified и ложный 304 на If-Modified-Since. Пока секунда
+    не прошла - None, и проверка идёт только по ETag."""
+    last_modified = recipe.modified.timestamp()
+    if request.user.is_authenticated:
+        last_modified = max(last_modified, get_viewer_stamp(request.user.id))
+    last_modified = floor(last_modified)
+    if last_modified + 1 > time.time():
+        return None
+    return last_modified
+
+
+def get_not_modified_response(request, etag, last_modified=None):
+    """304 по If-None-Match / If-Modified-Since или None, если ответ надо
+    строить целиком."""
+    if not (
+        'HTTP_IF_NONE_MATCH' in request.META
+        or 'HTTP_IF_MODIFIED_SINCE' in request.META
+    ):
+        return None
+    metrics.incr('recipes.conditional')
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified
+    )
+    if response is None:
+        return None
+    metrics.incr('recipes.not_modified')
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
@@ -0,0 +1,135 @@
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+
+from recipes.models import Favorite, Recipe, RecipeCounterShard, ShoppingList
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingList: 'cart_count',
+}
+FOLD_CHUNK_SIZE = 1000
+
+
+def add_to_counter(model, recipe_id, delta):
+    """Прибавляет delta к счётчику рецепта (избранное или корзина) в
+    случайном из RECIPE_COUNTER_SHARDS шардов: одновременные клики по
+    популярному рецепту обновляют разные строки и не ждут друг друга."""
+    field = COUNTER_FIELDS[model]
+    shard = random.randrange(settings.RECIPE_COUNTER_SHARDS)
+    shards = RecipeCounterShard.objects.filter(
+        recipe_id=recipe_id, shard=shard
+    )
+    if shards.update(**{field: F(field) + delta}):
+        return
+    try:
+        with transaction.atomic():
+            RecipeCounterShard.objects.create(
+                recipe_id=recipe_id, shard=shard, **{field: delta}
+            )
+    except IntegrityError:
+        shards.update(**{field: F(field) + delta})
+
+
+def get_recipe_counters(recipe):
+    """Точные счётчики рецепта: свёрнутые в Recipe и ещё лежащие в
+    шардах."""
+    pending = recipe.counter_shards.aggregate(
+        **{field: Sum(field) for field in COUNTER_FIELDS.values()}
+    )
+    return {
+        field: getattr(recipe, field) + (pending[field] or 0)
+        for field in COUNTER_FIELDS.values()
+    }
+
+
+def fold_counters():
+    """Переносит шарды в Recipe.favorites_count/cart_count и удаляет их.
+    Шарды рецепта сворачиваются вместе, иначе -1 одного шарда без +1
+    другого увёл бы счётчик ниже нуля. Шарды блокируются на время
+    переноса; приращения, пришедшие после, создают новые шарды.
+    Возвращает число свёрнутых шардов."""
+    folded, last_recipe_id = 0, 0
+    while True:
+        recipe_ids = list(
+            RecipeCounterShard.objects.filter(recipe_id__gt=last_recipe_id)
+            .order_by('recipe_id')
+            .values_list('recipe_id', flat=True)
+            .distinct()[:FOLD_CHUNK_SIZE]
+        )
+        if not recipe_ids:
+            return folded
+        last_recipe_id = recipe_ids[-1]
+        with transaction.atomic():
+            shards = list(
+                RecipeCounterShard.objects.select_for_update()
+                .filter(recipe_id__in=recipe_ids)
+                .values_list('id', 'recipe_id', *COUNTER_FIELDS.values())
+            )
+            totals = defaultdict(Counter)
+            for _, recipe_id, *deltas in shards:
+                totals[recipe_id].update(
+                    dict(zip(COUNTER_FIELDS.values(), deltas))
+                )
+            for recipe_id, deltas in totals.items():
+                deltas = {
+                    field: F(field) + delta
+                    for field, delta in deltas.items() if delta
+                }
+                if deltas:
+                    Recipe.objects.filter(pk=recipe_id).update(**deltas)
+            RecipeCounterShard.objects.filter(
+                pk__in=[shard[0] for shard in shards]
+            ).delete()
+        folded += len(shards)
+
+
+def reconcile_counters(recipe_ids, fix=True):
+    """Сверяет счётчики рецептов recipe_ids (вместе с шардами) с COUNT по
+    Favorite и ShoppingList. Если fix, счётчикам присваивается COUNT, а
+    учтённые им шарды удаляются: они заблокированы до конца транзакции,
+    поэтому клик, который ещё не зафиксирован, попадёт в новый шард.
+    Возвращает число расхождений по каждому счётчику."""
+    fields = tuple(COUNTER_FIELDS.values())
+    drift = Counter(dict.fromkeys(fields, 0))
+    with transaction.atomic():
+        shards = RecipeCounterShard.objects.filter(recipe_id__in=recipe_ids)
+        if fix:
+            shards = shards.select_for_update()
+        shard_ids, pending = [], defaultdict(Counter)
+        for pk, recipe_id, *deltas in shards.values_list(
+            'id', 'recipe_id', *fields
+        ):
+            shard_ids.append(pk)
+            pending[recipe_id].update(dict(zip(fields, deltas)))
+        actual = {
+            field: dict(
+                model.objects.filter(recipe_id__in=recipe_ids)
+                .values_list('recipe_id')
+                .annotate(total=Count('id'))
+                .order_by()
+            )
+            for model, field in COUNTER_FIELDS.items()
+        }
+        changed = []
+        for recipe in Recipe.objects.filter(pk__in=recipe_ids).only(
+            'id', *fields
+        ):
+            update = False
+            for field in fields:
+                expected = actual[field].get(recipe.id, 0)
+                value = getattr(recipe, field)
+                if value + pending[recipe.id][field] != expected:
+                    drift[field] += 1
+                if value != expected:
+                    setattr(recipe, field, expected)
+                    update = True
+            if update:
+                changed.append(recipe)
+        if fix:
+            Recipe.objects.bulk_update(changed, fields)
+            RecipeCounterShard.objects.filter(pk__in=shard_ids).delete()
+    return drift
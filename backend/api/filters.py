@@ -1,16 +1,39 @@
 import django_filters
+from django.conf import settings
+from django.contrib.postgres.fields import ArrayField
+from django.db import connection
+from django.db.models import Exists, F, Func, IntegerField, OuterRef, Q
 
+from api.recipe_sets import RECIPE_SET_MODELS, get_recipe_ids
 from recipes.models import Recipe, Tag
 
 FILTER_CHOICES = (('0', False), ('1', True))
 
 
-def get_filtered_queryset(queryset, recipes, value):
-    return (
-        queryset.filter(id__in=recipes)
-        if dict(FILTER_CHOICES)[value]
-        else queryset.exclude(id__in=recipes)
-    )
+def get_filtered_queryset(queryset, user, name, value):
+    """Рецепты из избранного или корзины пользователя (value='1') или
+    вне их (value='0').
+
+    Множество id берётся из кэша (api.recipe_sets). Пока оно меньше
+    RECIPE_SET_ID_LIST_MAX, в запрос подставляется список id, который
+    проверяется по первичному ключу. Для больших множеств используется
+    EXISTS / NOT EXISTS по таблице связи: СУБД выполняет их как
+    полу- и антисоединение, в отличие от NOT IN (подзапрос). Пустое
+    множество фильтруется без запроса к БД.
+    """
+    selected = dict(FILTER_CHOICES)[value]
+    recipe_ids = get_recipe_ids(user, name)
+    if not recipe_ids:
+        return queryset.none() if selected else queryset
+    if len(recipe_ids) < settings.RECIPE_SET_ID_LIST_MAX:
+        recipes = Q(id__in=sorted(recipe_ids))
+    else:
+        recipes = Exists(
+            RECIPE_SET_MODELS[name].objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )
+        )
+    return queryset.filter(recipes if selected else ~recipes)
 
 
 class RecipeFilter(django_filters.FilterSet):
@@ -26,15 +49,13 @@ class RecipeFilter(django_filters.FilterSet):
         user = self.request.user
         if user.is_anonymous:
             return Recipe.objects.none()
-        recipes = user.favorites.values('recipe__id')
-        return get_filtered_queryset(queryset, recipes, value)
+        return get_filtered_queryset(queryset, user, 'favorites', value)
 
     def is_in_shopping_cart_method(self, queryset, name, value):
         user = self.request.user
         if user.is_anonymous:
             return Recipe.objects.none()
-        recipes = user.shopping_list.values('recipe__id')
-        return get_filtered_queryset(queryset, recipes, value)
+        return get_filtered_queryset(queryset, user, 'shopping_cart', value)
 
     author = django_filters.NumberFilter(
         field_name='author', lookup_expr='exact'
@@ -43,8 +64,31 @@ class RecipeFilter(django_filters.FilterSet):
         field_name='tags__slug',
         to_field_name='slug',
         queryset=Tag.objects.all(),
+        method='tags_method',
     )
 
+    def tags_method(self, queryset, name, value):
+        """Рецепты хотя бы с одним из тегов: проверка Recipe.tags_mask
+        без соединения с RecipeTag.
+
+        На PostgreSQL маска раскладывается в массив номеров битов
+        (recipes_tag_bits, миграция recipes.0010), и пересечение && идёт
+        по GIN-индексу; условие tags_mask & mask > 0 индексом не
+        обслуживается."""
+        if not value:
+            return queryset
+        if connection.vendor == 'postgresql':
+            return queryset.alias(
+                tag_bits=Func(
+                    F('tags_mask'),
+                    function='recipes_tag_bits',
+                    output_field=ArrayField(IntegerField()),
+                )
+            ).filter(tag_bits__overlap=[tag.bit for tag in value])
+        return queryset.alias(
+            tag_bits=F('tags_mask').bitand(Tag.get_mask(value))
+        ).filter(tag_bits__gt=0)
+
     class Meta:
         model = Recipe
         fields = ('author', 'tags')
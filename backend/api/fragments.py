@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from api import metrics
+from api.cache import get_version
+from api.serializers import RecipeCardSerializer
+from api.utils import prefetch_recipe_relations
+from recipes.models import Recipe
+
+FRAGMENT_KEY = 'recipe_fragment:{}:{}:{}'
+
+
+def get_fragment_key(recipe, version):
+    return FRAGMENT_KEY.format(
+        version, recipe.id, int(recipe.modified.timestamp() * 1000000)
+    )
+
+
+def get_recipe_fragments(recipes):
+    """Не зависящие от пользователя части рецептов (как Recipe.card) из
+    кэша по id рецепта и версии 'recipe_fragments'. Промахи дочитываются
+    из БД одним запросом и кладутся в кэш.
+
+    Ключ включает Recipe.modified, который меняется в той же транзакции,
+    что и данные карточки. Фрагмент, прочитанный до коммита, ложится под
+    старый ключ, поэтому сбрасывать кэш при изменении не нужно."""
+    version = get_version('recipe_fragments')
+    keys = {get_fragment_key(recipe, version): recipe for recipe in recipes}
+    fragments = {
+        keys[key].id: fragment
+        for key, fragment in cache.get_many(keys).items()
+    }
+    missing = [
+        recipe.id for recipe in keys.values() if recipe.id not in fragments
+    ]
+    metrics.incr('recipe_fragments.hits', len(fragments))
+    metrics.incr('recipe_fragments.misses', len(missing))
+    if not missing:
+        return fragments
+
+    loaded = list(Recipe.objects.filter(pk__in=missing))
+    prefetch_recipe_relations(loaded)
+    fresh = {
+        recipe: recipe.card or RecipeCardSerializer(recipe).data
+        for recipe in loaded
+    }
+    # ключ по modified прочитанной строки: данные и версия совпадают
+    cache.set_many(
+        {
+            get_fragment_key(recipe, version): data
+            for recipe, data in fresh.items()
+        },
+        settings.RECIPE_FRAGMENT_TIMEOUT,
+    )
+    fragments.update((recipe.id, data) for recipe, data in fresh.items())
+    return fragments
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from api import metrics
+from api.shopping_cache import get_shopping_list_report, shopping_list_cache
+from recipes.models import ShoppingListJob
+
+ACTIVE_STATUSES = (ShoppingListJob.PENDING, ShoppingListJob.RUNNING)
+
+_executor = None
+_executor_lock = threading.Lock()
+# Задания, поставленные в пул этого процесса: id -> time.monotonic().
+_submitted = {}
+
+
+class QueueFull(Exception):
+    pass
+
+
+def get_executor():
+    """Пул потоков процесса, не больше REPORT_JOB_WORKERS отрисовок
+    одновременно."""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=settings.REPORT_JOB_WORKERS,
+                    thread_name_prefix='report-job',
+                )
+    return _executor
+
+
+def submit(job_id):
+    """Ставит задание в пул после фиксации транзакции, иначе поток может
+    не увидеть запись. Задание, уже ждущее в пуле этого процесса, снова
+    ставится только через REPORT_JOB_RESUBMIT_AFTER секунд: recover
+    вызывается на каждом опросе."""
+    now = time.monotonic()
+    with _executor_lock:
+        submitted = _submitted.get(job_id)
+        if (
+            submitted is not None
+            and now - submitted < settings.REPORT_JOB_RESUBMIT_AFTER
+        ):
+            return
+        _submitted[job_id] = now
+    transaction.on_commit(lambda: get_executor().submit(run_job, job_id))
+
+
+def enqueue_shopping_list(user):
+    """Задание на PDF списка покупок пользователя. Незавершённое задание
+    пользователя переиспользуется; при REPORT_JOB_QUEUE_LIMIT заданий в
+    очереди новое не создаётся (QueueFull)."""
+    job = user.shopping_list_jobs.filter(status__in=ACTIVE_STATUSES).first()
+    if job is not None:
+        return recover(job)
+    pending = ShoppingListJob.objects.filter(
+        status=ShoppingListJob.PENDING
+    ).count()
+    if pending >= settings.REPORT_JOB_QUEUE_LIMIT:
+        raise QueueFull
+    job = ShoppingListJob.objects.create(user=user)
+    metrics.incr('report_jobs.enqueued')
+    submit(job.id)
+    return job
+
+
+def recover(job):
+    """Снова ставит в пул задание в очереди (пул мог пропасть вместе с
+    перезапущенным процессом) и возвращает в очередь задание, которое
+    выполняется дольше REPORT_JOB_TIMEOUT секунд. Повторная постановка
+    безопасна: задание выполнит только тот, кто его заберёт."""
+    if job.status == ShoppingListJob.RUNNING:
+        stale = timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+        if not ShoppingListJob.objects.filter(
+            pk=job.pk, status=ShoppingListJob.RUNNING, started__lt=stale
+        ).update(status=ShoppingListJob.PENDING):
+            return job
+        job.status = ShoppingListJob.PENDING
+    if job.status == ShoppingListJob.PENDING:
+        submit(job.id)
+    return job
+
+
+def run_job(job_id):
+    """Выполняет задание, если его ещё не забрал другой поток или
+    процесс: переход pending -> running делается одним UPDATE."""
+    with _executor_lock:
+        _submitted.pop(job_id, None)
+    try:
+        claimed = ShoppingListJob.objects.filter(
+            pk=job_id, status=ShoppingListJob.PENDING
+        ).update(status=ShoppingListJob.RUNNING, started=timezone.now())
+        if not claimed:
+            return
+        job = ShoppingListJob.objects.select_related('user').get(pk=job_id)
+        try:
+            with get_shopping_list_report(job.user) as report_file:
+                job.file_name = os.path.basename(report_file.name)
+            job.status = ShoppingListJob.DONE
+        except Exception as error:
+            job.status = ShoppingListJob.FAILED
+            job.error = repr(error)
+        job.finished = timezone.now()
+        job.save(update_fields=('status', 'file_name', 'error', 'finished'))
+        metrics.incr(f'report_jobs.{job.status}')
+        metrics.incr(
+            'report_jobs.render_ms',
+            int((job.finished - job.started).total_seconds() * 1000),
+        )
+    finally:
+        connection.close()
+
+
+def open_job_result(job):
+    """Готовый PDF задания или None, если файла нет (вытеснен из кэша или
+    имя не записано): тогда задание снова ставится в очередь."""
+    pdf_file = (
+        shopping_list_cache.open(job.file_name) if job.file_name else None
+    )
+    if pdf_file is None:
+        ShoppingListJob.objects.filter(pk=job.pk).update(
+            status=ShoppingListJob.PENDING, file_name=''
+        )
+        job.status = ShoppingListJob.PENDING
+        submit(job.id)
+    return pdf_file
+
+
+def get_job_metrics(values):
+    """Глубина очереди и среднее время отрисовки для /api/metrics/ по
+    счётчикам values (api.metrics.get_metrics)."""
+    counts = dict.fromkeys(ACTIVE_STATUSES, 0)
+    counts.update(
+        ShoppingListJob.objects.filter(status__in=ACTIVE_STATUSES)
+        .order_by()
+        .values_list('status')
+        .annotate(count=Count('id'))
+    )
+    completed = values['report_jobs.done'] + values['report_jobs.failed']
+    return {
+        'report_jobs.queue_depth': counts[ShoppingListJob.PENDING],
+        'report_jobs.running': counts[ShoppingListJob.RUNNING],
+        'report_jobs.render_ms_avg': (
+            round(values['report_jobs.render_ms'] / completed, 1)
+            if completed else None
+        ),
+    }
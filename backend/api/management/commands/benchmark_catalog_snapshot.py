@@ -0,0 +1,122 @@
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from api.cache import CatalogSnapshot, build_ingredients, build_tags
+from api.snapshot import MappedCatalog, write_snapshot
+
+
+def memory_usage():
+    """Rss и частная (Private_*) память процесса в КБ
+    (Linux, /proc/self/smaps_rollup)."""
+    usage = {'Rss': 0, 'Private': 0}
+    with open('/proc/self/smaps_rollup') as smaps:
+        for line in smaps:
+            key, _, value = line.partition(':')
+            if key == 'Rss':
+                usage['Rss'] += int(value.split()[0])
+            elif key.startswith('Private_'):
+                usage['Private'] += int(value.split()[0])
+    return usage
+
+
+def run_worker(mode, path, ids, barrier, results):
+    baseline = memory_usage()
+    catalog = MappedCatalog(path)
+    if mode == 'dict':
+        items = [catalog.ingredient(pk) for pk in sorted(ids)]
+        section = CatalogSnapshot('ingredients', 0, items)
+        del catalog, items
+    else:
+        section = catalog.section('ingredients')
+
+    for pk in ids:
+        section.detail_body(pk)
+    started = time.process_time()
+    for pk in ids:
+        section.detail_body(pk)
+    elapsed = time.process_time() - started
+
+    barrier.wait()
+    usage = memory_usage()
+    results.put(
+        {
+            'rss': usage['Rss'] - baseline['Rss'],
+            'private': usage['Private'] - baseline['Private'],
+            'lookup_us': elapsed / len(ids) * 1e6,
+        }
+    )
+    barrier.wait()
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнение памяти воркеров и задержки поиска: словари в каждом'
+        ' процессе против общего снимка в mmap'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument(
+            '--scale',
+            type=int,
+            default=50,
+            help='Во сколько раз размножить каталог ингредиентов',
+        )
+
+    def run_mode(self, mode, path, ids, workers):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(workers)
+        results = context.Queue()
+        processes = [
+            context.Process(
+                target=run_worker, args=(mode, path, ids, barrier, results)
+            )
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        stats = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+        return {
+            key: sum(item[key] for item in stats) / workers
+            for key in stats[0]
+        }
+
+    def handle(self, *args, **options):
+        base = build_ingredients()
+        tags = build_tags()
+        connections.close_all()
+
+        step = max((item['id'] for item in base), default=0)
+        ingredients = [
+            dict(item, id=item['id'] + step * copy)
+            for copy in range(options['scale'])
+            for item in base
+        ]
+        ids = [item['id'] for item in ingredients]
+        random.shuffle(ids)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'catalog.snapshot')
+            write_snapshot(
+                path, ingredients, tags, {'ingredients': 0, 'tags': 0}
+            )
+            self.stdout.write(
+                f'{len(ingredients)} ingredients,'
+                f' snapshot {os.path.getsize(path) // 1024} KB,'
+                f' {options["workers"]} workers'
+            )
+            for mode in ('dict', 'mmap'):
+                stats = self.run_mode(mode, path, ids, options['workers'])
+                self.stdout.write(
+                    f'{mode:>5}: rss/worker={stats["rss"]:8.0f} KB'
+                    f'  private/worker={stats["private"]:8.0f} KB'
+                    f'  lookup={stats["lookup_us"]:6.2f} us'
+                )
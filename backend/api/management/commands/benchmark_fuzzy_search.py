@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.search import IngredientIndex
+from recipes.models import Ingredient
+
+DEFAULT_QUERIES = ('помидоры', 'морков', 'молако', 'сыр чедер', 'ёжевика')
+SUFFIXES = ('', ' свежий', ' сушеный', ' консервированный', ' молотый')
+
+
+class Command(BaseCommand):
+    help = 'Нечёткий поиск ингредиентов на синтетическом каталоге'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', type=int, default=100000, help='Размер каталога'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=20, help='Повторов на запрос'
+        )
+        parser.add_argument(
+            '--query',
+            action='append',
+            dest='queries',
+            help='Строка поиска (можно указать несколько раз)',
+        )
+
+    @staticmethod
+    def get_catalog(size):
+        base = list(
+            Ingredient.objects.values_list('name', 'measurement_unit__name')
+        ) or [('помидоры', 'г'), ('морковь', 'г'), ('молоко', 'мл')]
+        rows = []
+        for pos in range(size):
+            name, unit = base[pos % len(base)]
+            suffix = SUFFIXES[(pos // len(base)) % len(SUFFIXES)]
+            batch = pos // (len(base) * len(SUFFIXES))
+            rows.append(
+                (pos + 1, f'{name}{suffix}' + (f' {batch}' if batch else ''),
+                 unit)
+            )
+        rows.sort(key=lambda row: (row[1], row[0]))
+        return rows
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        index = IngredientIndex.from_rows(self.get_catalog(options['size']))
+        self.stdout.write(
+            f'{options["size"]} ingredients indexed in'
+            f' {time.perf_counter() - started:.2f} s,'
+            f' budget {settings.FUZZY_SEARCH_BUDGET_MS} ms'
+        )
+
+        for string in options['queries'] or DEFAULT_QUERIES:
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                rows = index.fuzzy_search(string)
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            line = (
+                f'{string!r:>20}: p50={timings[len(timings) // 2]:7.2f} ms'
+                f' max={timings[-1]:7.2f} ms'
+                f' top={rows[0]["name"] if rows else "-"!r}'
+            )
+            over = timings[-1] > settings.FUZZY_SEARCH_BUDGET_MS * 2
+            self.stdout.write(
+                self.style.WARNING(line) if over else self.style.SUCCESS(line)
+            )
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.search import IngredientIndex, ingredient_search_queryset
+
+DEFAULT_QUERIES = ('м', 'мо', 'мол', 'молоко', 'сах', 'соль', 'ка', 'ов')
+
+
+class Command(BaseCommand):
+    help = 'Сравнение поиска ингредиентов: запрос к БД и индекс в памяти'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=50, help='Повторов на запрос'
+        )
+        parser.add_argument(
+            '--query',
+            action='append',
+            dest='queries',
+            help='Строка поиска (можно указать несколько раз)',
+        )
+
+    @staticmethod
+    def measure(func, repeat):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            result = func()
+        return (time.perf_counter() - started) / repeat * 1000, result
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        queries = options['queries'] or DEFAULT_QUERIES
+        index = IngredientIndex()
+        if connection.vendor == 'sqlite':
+            self.stdout.write(
+                self.style.WARNING(
+                    'SQLite LIKE is case-insensitive for ASCII only:'
+                    ' rankings for Cyrillic queries may differ.'
+                )
+            )
+
+        started = time.perf_counter()
+        index.refresh()
+        self.stdout.write(
+            f'index build: {(time.perf_counter() - started) * 1000:.2f} ms'
+        )
+
+        for string in queries:
+            orm_ms, orm_rows = self.measure(
+                lambda: list(
+                    ingredient_search_queryset(string).values_list(
+                        'id', flat=True
+                    )
+                ),
+                repeat,
+            )
+            index_ms, index_rows = self.measure(
+                lambda: [row['id'] for row in index.search(string)], repeat
+            )
+            same = orm_rows == index_rows
+            line = (
+                f'{string!r:>12}: rows={len(index_rows):<5}'
+                f' orm={orm_ms:8.3f} ms  index={index_ms:8.3f} ms'
+                f'  x{orm_ms / max(index_ms, 1e-6):.1f}'
+            )
+            self.stdout.write(
+                self.style.SUCCESS(line) if same else self.style.ERROR(
+                    f'{line}  ranking differs'
+                )
+            )
@@ -0,0 +1,99 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, connection, transaction
+from django.test import override_settings
+
+from api.counters import fold_counters, get_recipe_counters
+from recipes.models import Favorite, Recipe
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пропускная способность добавления и удаления рецепта в избранное'
+        ' при одновременных писателях: один шард счётчика против'
+        ' нескольких'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument(
+            '--toggles',
+            type=int,
+            default=200,
+            help='Сколько раз каждый поток добавляет и удаляет рецепт',
+        )
+        parser.add_argument(
+            '--shards', type=int, nargs='+', default=(1, 16)
+        )
+
+    def get_users(self, count):
+        users = []
+        for number in range(count):
+            user, _ = User.objects.get_or_create(
+                username=f'counter_benchmark_{number}',
+                defaults={
+                    'email': f'counter_benchmark_{number}@example.com',
+                    'first_name': 'counter',
+                    'last_name': 'benchmark',
+                },
+            )
+            users.append(user)
+        return users
+
+    @staticmethod
+    def toggle(user, recipe, toggles, barrier):
+        errors = 0
+        barrier.wait()
+        try:
+            for _ in range(toggles):
+                try:
+                    with transaction.atomic():
+                        Favorite.objects.create(user=user, recipe=recipe)
+                    with transaction.atomic():
+                        Favorite.objects.filter(
+                            user=user, recipe=recipe
+                        ).delete()
+                except DatabaseError:
+                    errors += 1
+        finally:
+            connection.close()
+        return errors
+
+    def measure(self, users, recipe, toggles):
+        barrier = threading.Barrier(len(users))
+        started = time.perf_counter()
+        with ThreadPoolExecutor(len(users)) as pool:
+            errors = sum(pool.map(
+                lambda user: self.toggle(user, recipe, toggles, barrier),
+                users,
+            ))
+        return time.perf_counter() - started, errors
+
+    def handle(self, *args, **options):
+        recipe = Recipe.objects.order_by('id').first()
+        if recipe is None:
+            self.stderr.write('no recipes in the database')
+            return
+        users = self.get_users(options['threads'])
+        toggles = options['toggles'] * len(users)
+        for shards in options['shards']:
+            Favorite.objects.filter(user__in=users, recipe=recipe).delete()
+            with override_settings(RECIPE_COUNTER_SHARDS=shards):
+                elapsed, errors = self.measure(
+                    users, recipe, options['toggles']
+                )
+            recipe.refresh_from_db()
+            counted = get_recipe_counters(recipe)['favorites_count']
+            actual = recipe.in_favorite.count()
+            self.stdout.write(
+                f'{shards:>3} shards, {len(users)} writers:'
+                f' {(toggles - errors) / elapsed:8.1f} toggles/s,'
+                f' {errors} failed,'
+                f' counter {"ok" if counted == actual else "DRIFTED"}'
+            )
+        Favorite.objects.filter(user__in=users, recipe=recipe).delete()
+        fold_counters()
@@ -0,0 +1,120 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from recipes.models import Recipe
+from users.models import User
+from users.pagination import (
+    CustomPageNumberPagination, RecipeCursorPagination,
+)
+
+BATCH_SIZE = 10000
+
+
+class Command(BaseCommand):
+    help = (
+        'Время ответа глубоких страниц ленты рецептов: номер страницы'
+        ' (COUNT + OFFSET) против курсора по (pub_date, id)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=100000,
+            help='Сколько рецептов должно быть в базе на время замера',
+        )
+        parser.add_argument(
+            '--fill',
+            action='store_true',
+            help='Создать недостающие рецепты. Они существуют только в'
+            ' транзакции замера и откатываются после него',
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def fill(self, total):
+        missing = total - Recipe.objects.count()
+        if missing <= 0:
+            return
+        author, _ = User.objects.get_or_create(
+            username='feed_benchmark',
+            defaults={
+                'email': 'feed_benchmark@example.com',
+                'first_name': 'feed',
+                'last_name': 'benchmark',
+            },
+        )
+        start = author.recipes.count()
+        self.stdout.write(f'creating {missing} recipes...')
+        for offset in range(0, missing, BATCH_SIZE):
+            Recipe.objects.bulk_create(
+                Recipe(
+                    name=f'feed benchmark {start + number}',
+                    text='feed benchmark',
+                    cooking_time=1,
+                    image='recipes/images/feed_benchmark.gif',
+                    author=author,
+                )
+                for number in range(
+                    offset, min(offset + BATCH_SIZE, missing)
+                )
+            )
+
+    def measure(self, paginator, params, repeat):
+        request = Request(APIRequestFactory().get('/api/recipes/', params))
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            paginator.paginate_queryset(Recipe.objects.all(), request)
+            timings.append((time.perf_counter() - started) * 1000)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        if not options['fill']:
+            self.run(options)
+            return
+        with transaction.atomic():
+            self.fill(options['recipes'])
+            self.run(options)
+            # созданные для замера рецепты в базе не остаются
+            transaction.set_rollback(True)
+
+    def run(self, options):
+        total = Recipe.objects.count()
+        if total < options['recipes'] and not options['fill']:
+            self.stdout.write(
+                f'в базе {total} рецептов из {options["recipes"]};'
+                ' --fill создаст недостающие на время замера'
+            )
+        page_size = CustomPageNumberPagination.page_size
+        last_page = max(total // page_size, 1)
+        pages = sorted(
+            {1, 10, 100, 1000, 10000, last_page // 2, last_page} - {0}
+        )
+        self.stdout.write(f'{total} recipes, page size {page_size}')
+
+        for page in (page for page in pages if page <= last_page):
+            offset = (page - 1) * page_size
+            cursor = ''
+            if offset:
+                recipe = Recipe.objects.order_by('-pub_date', '-id').only(
+                    'id', 'pub_date'
+                )[offset - 1]
+                cursor = RecipeCursorPagination.encode_cursor(recipe)
+            number_ms = self.measure(
+                CustomPageNumberPagination(),
+                {'page': page},
+                options['repeat'],
+            )
+            cursor_ms = self.measure(
+                RecipeCursorPagination(),
+                {'cursor': cursor},
+                options['repeat'],
+            )
+            self.stdout.write(
+                f'page {page:>7}: page_number={number_ms:9.2f} ms'
+                f'  cursor={cursor_ms:7.2f} ms'
+            )
@@ -0,0 +1,71 @@
+import io
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.report import (
+    REPORT_BACKENDS, get_shopping_list_text, get_shopping_list_title,
+)
+
+UNITS = ('г', 'кг', 'мл', 'шт.', 'ст. л.')
+
+
+class Command(BaseCommand):
+    help = (
+        'Время отрисовки и размер отчёта каждым движком api.report'
+        ' для списков покупок разной длины'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lines',
+            type=int,
+            nargs='+',
+            default=(10, 100, 1000),
+            help='Длины списков',
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--backends',
+            nargs='+',
+            choices=tuple(REPORT_BACKENDS),
+            default=tuple(REPORT_BACKENDS),
+        )
+
+    @staticmethod
+    def get_lines(count):
+        rng = random.Random(count)
+        return [
+            get_shopping_list_text(
+                ingredient__name=f'ингредиент номер {number}',
+                ingredient__measurement_unit__name=rng.choice(UNITS),
+                amount=rng.randint(1, 1000),
+            )
+            for number in range(count)
+        ]
+
+    @staticmethod
+    def measure(backend, lines, repeat):
+        timings = []
+        for _ in range(repeat):
+            output = io.BytesIO()
+            started = time.perf_counter()
+            backend.write(lines, get_shopping_list_title('benchmark'), output)
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2], len(output.getvalue())
+
+    def handle(self, *args, **options):
+        backends = [REPORT_BACKENDS[name] for name in options['backends']]
+        for backend in backends:
+            # Регистрация шрифта и стилей не входит в замер.
+            backend.write(self.get_lines(1), '', io.BytesIO())
+        for count in options['lines']:
+            lines = self.get_lines(count)
+            for backend in backends:
+                median, size = self.measure(backend, lines, options['repeat'])
+                self.stdout.write(
+                    f'{count:>6} lines {backend.name:>8}:'
+                    f' median {median:9.2f} ms, {size:>9} bytes'
+                )
@@ -0,0 +1,91 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api import report
+from api.shopping_cache import drop_shopping_list
+from api.shopping_items import rebuild_shopping_items
+from api.views import download_shopping_cart
+from recipes.models import Recipe, ShoppingList
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Время и выделения памяти download_shopping_cart: с регистрацией'
+        ' шрифта и стилей на каждый запрос (uncached), однократной (cached)'
+        ' и готовый файл из кэша списков покупок (file)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=50,
+            help='Сколько рецептов положить в корзину пользователя',
+        )
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def get_user(self, recipes):
+        user, _ = User.objects.get_or_create(
+            username='pdf_benchmark',
+            defaults={
+                'email': 'pdf_benchmark@example.com',
+                'first_name': 'pdf',
+                'last_name': 'benchmark',
+            },
+        )
+        user.shopping_list.all().delete()
+        ShoppingList.objects.bulk_create(
+            ShoppingList(user=user, recipe_id=pk)
+            for pk in Recipe.objects.filter(
+                recipe_ingredient__isnull=False
+            ).distinct().values_list('id', flat=True)[:recipes]
+        )
+        rebuild_shopping_items([user.id])
+        return user
+
+    @staticmethod
+    def reset_setup():
+        report._styles.clear()
+        pdfmetrics.registerFont(
+            TTFont(report.FONT_NAME, 'DejaVuSerif.ttf', 'UTF-8')
+        )
+
+    def measure(self, user, repeat, mode):
+        factory = APIRequestFactory()
+        timings, peaks = [], []
+        for _ in range(repeat):
+            request = factory.get('/api/recipes/download_shopping_cart/')
+            force_authenticate(request, user)
+            if mode != 'file':
+                drop_shopping_list(user)
+            tracemalloc.start()
+            started = time.perf_counter()
+            if mode == 'uncached':
+                self.reset_setup()
+            response = download_shopping_cart(request)
+            size = len(b''.join(response.streaming_content))
+            timings.append((time.perf_counter() - started) * 1000)
+            peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            tracemalloc.stop()
+        timings.sort()
+        return timings[len(timings) // 2], max(peaks), size
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['recipes'])
+        self.stdout.write(
+            f'{user.shopping_list.count()} recipes in the shopping cart'
+        )
+        self.measure(user, 1, 'cached')
+        for mode in ('uncached', 'cached', 'file'):
+            median, peak, size = self.measure(user, options['repeat'], mode)
+            self.stdout.write(
+                f'{mode:>8}:'
+                f' median {median:8.2f} ms, peak {peak:9.1f} KiB,'
+                f' pdf {size} bytes'
+            )
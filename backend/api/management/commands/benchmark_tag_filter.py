@@ -0,0 +1,164 @@
+import random
+import time
+from itertools import combinations
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.filters import RecipeFilter
+from recipes.models import Recipe, RecipeTag, Tag
+from users.models import User
+
+BATCH_SIZE = 10000
+PAGE_SIZE = 6
+
+
+class Command(BaseCommand):
+    help = (
+        'Фильтр ленты по тегам: соединение с RecipeTag (tags__slug__in'
+        ' + DISTINCT) против проверки Recipe.tags_mask'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes',
+            type=int,
+            default=100000,
+            help='Сколько рецептов должно быть в базе на время замера',
+        )
+        parser.add_argument(
+            '--fill',
+            action='store_true',
+            help='Создать недостающие рецепты со случайными тегами. Они'
+            ' существуют только в транзакции замера и откатываются после'
+            ' него',
+        )
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument(
+            '--explain',
+            action='store_true',
+            help='Показать план первой страницы для фильтра по маске',
+        )
+
+    def fill(self, total, tags):
+        missing = total - Recipe.objects.count()
+        if missing <= 0:
+            return
+        author, _ = User.objects.get_or_create(
+            username='tag_benchmark',
+            defaults={
+                'email': 'tag_benchmark@example.com',
+                'first_name': 'tag',
+                'last_name': 'benchmark',
+            },
+        )
+        start = author.recipes.count()
+        self.stdout.write(f'creating {missing} recipes...')
+        for offset in range(0, missing, BATCH_SIZE):
+            size = min(BATCH_SIZE, missing - offset)
+            chosen = [
+                random.sample(tags, random.randint(1, len(tags)))
+                for _ in range(size)
+            ]
+            last_id = author.recipes.order_by('-id').values_list(
+                'id', flat=True
+            ).first() or 0
+            Recipe.objects.bulk_create(
+                Recipe(
+                    name=f'tag benchmark {start + offset + number}',
+                    text='tag benchmark',
+                    cooking_time=1,
+                    image='recipes/images/tag_benchmark.gif',
+                    author=author,
+                    tags_mask=Tag.get_mask(recipe_tags),
+                )
+                for number, recipe_tags in enumerate(chosen)
+            )
+            recipe_ids = author.recipes.filter(id__gt=last_id).order_by(
+                'id'
+            ).values_list('id', flat=True)
+            RecipeTag.objects.bulk_create(
+                RecipeTag(recipe_id=recipe_id, tag=tag)
+                for recipe_id, recipe_tags in zip(recipe_ids, chosen)
+                for tag in recipe_tags
+            )
+
+    @staticmethod
+    def join_queryset(slugs):
+        return Recipe.objects.filter(tags__slug__in=slugs).distinct()
+
+    @staticmethod
+    def mask_queryset(slugs):
+        request = Request(APIRequestFactory().get('/api/recipes/'))
+        request.user = AnonymousUser()
+        return RecipeFilter(
+            {'tags': slugs}, queryset=Recipe.objects.all(), request=request
+        ).qs
+
+    @staticmethod
+    def first_page(queryset):
+        return list(
+            queryset.order_by('-pub_date', '-id').values_list(
+                'id', flat=True
+            )[:PAGE_SIZE]
+        )
+
+    def measure(self, queryset, repeat):
+        page, count = [], []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            self.first_page(queryset)
+            page.append((time.perf_counter() - started) * 1000)
+            started = time.perf_counter()
+            queryset.count()
+            count.append((time.perf_counter() - started) * 1000)
+        return min(page), min(count)
+
+    def handle(self, *args, **options):
+        tags = list(Tag.objects.order_by('bit'))
+        if not tags:
+            self.stderr.write('no tags in the database')
+            return
+        if not options['fill']:
+            self.run(tags, options)
+            return
+        with transaction.atomic():
+            self.fill(options['recipes'], tags)
+            self.run(tags, options)
+            # созданные для замера рецепты в базе не остаются
+            transaction.set_rollback(True)
+
+    def run(self, tags, options):
+        total = Recipe.objects.count()
+        if total < options['recipes'] and not options['fill']:
+            self.stdout.write(
+                f'в базе {total} рецептов из {options["recipes"]};'
+                ' --fill создаст недостающие на время замера'
+            )
+        self.stdout.write(f'{total} recipes, {len(tags)} tags')
+
+        slugs = [tag.slug for tag in tags]
+        sets = [slugs[:1], slugs[-1:]]
+        sets += [list(pair) for pair in combinations(slugs, 2)][:3]
+        sets.append(slugs)
+        for combination in sets:
+            join, mask = (
+                self.join_queryset(combination),
+                self.mask_queryset(combination),
+            )
+            join_page, join_count = self.measure(join, options['repeat'])
+            mask_page, mask_count = self.measure(mask, options['repeat'])
+            same = self.first_page(join) == self.first_page(mask)
+            self.stdout.write(
+                f'{",".join(combination)}: '
+                f'page join={join_page:8.2f} ms mask={mask_page:8.2f} ms  '
+                f'count join={join_count:9.2f} ms mask={mask_count:9.2f} ms'
+                + ('' if same else '  RESULTS DIFFER')
+            )
+            if options['explain']:
+                self.stdout.write(
+                    mask.order_by('-pub_date', '-id')[:PAGE_SIZE].explain()
+                )
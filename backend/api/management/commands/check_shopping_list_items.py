@@ -0,0 +1,45 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from api.shopping_items import USERS_CHUNK_SIZE, rebuild_shopping_items
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает сводные списки покупок (ShoppingListItem) по'
+        ' корзинам, исправляет и показывает расхождения'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        user_ids = list(
+            User.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        total = Counter(missing=0, extra=0, wrong=0)
+        for start in range(0, len(user_ids), USERS_CHUNK_SIZE):
+            chunk = user_ids[start:start + USERS_CHUNK_SIZE]
+            total.update(
+                rebuild_shopping_items(chunk, fix=not options['dry_run'])
+            )
+        summary = (
+            f'{len(user_ids)} users checked in'
+            f' {time.perf_counter() - started:.2f} s:'
+            f' {total["missing"]} missing, {total["extra"]} extra,'
+            f' {total["wrong"]} wrong items'
+        )
+        if not sum(total.values()):
+            self.stdout.write(self.style.SUCCESS(summary))
+        elif options['dry_run']:
+            self.stdout.write(self.style.WARNING(summary))
+        else:
+            self.stdout.write(self.style.WARNING(summary + ' (fixed)'))
@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import groupby
+from operator import itemgetter
+
+import django
+from django.core.management.base import BaseCommand
+
+from api.renderers import (
+    SHOPPING_LIST_RENDERERS, ShoppingListPDFRenderer, write_buy_list,
+)
+from api.report import get_report_backend
+from recipes.models import ShoppingListItem
+
+ITEM_FIELDS = (
+    'ingredient__name', 'ingredient__measurement_unit__name', 'amount'
+)
+PROGRESS_INTERVAL = 2
+
+
+def export_buy_list(directory, format, user_id, username, items):
+    extension = (
+        get_report_backend().extension
+        if format == ShoppingListPDFRenderer.format else format
+    )
+    path = os.path.join(directory, f'{user_id}_{username}.{extension}')
+    with open(path, 'wb') as output:
+        write_buy_list(items, username, format, output)
+    return path
+
+
+def get_buy_lists(active):
+    """Списки покупок всех пользователей одним проходом по
+    ShoppingListItem, упорядоченным по пользователю."""
+    items = ShoppingListItem.objects.order_by('user_id', 'ingredient__name')
+    if active:
+        items = items.filter(user__is_active=True)
+    rows = items.values('user_id', 'user__username', *ITEM_FIELDS)
+    for (user_id, username), user_rows in groupby(
+        rows.iterator(), key=itemgetter('user_id', 'user__username')
+    ):
+        yield user_id, username, [
+            {field: row[field] for field in ITEM_FIELDS} for row in user_rows
+        ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает списки покупок всех пользователей в каталог, отрисовывая'
+        ' их в пуле процессов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Каталог для файлов')
+        parser.add_argument(
+            '--format',
+            default='pdf',
+            choices=[renderer.format for renderer in SHOPPING_LIST_RENDERERS],
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count(),
+            help='Число процессов отрисовки',
+        )
+        parser.add_argument(
+            '--all-users',
+            action='store_true',
+            help='Выгружать и неактивных пользователей',
+        )
+
+    def report(self, done, total, started):
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'{done}/{total} users, {elapsed:.1f} s,'
+            f' {done / elapsed if elapsed else 0:.1f} users/s'
+        )
+
+    def handle(self, *args, **options):
+        directory, format = options['output'], options['format']
+        os.makedirs(directory, exist_ok=True)
+        active = not options['all_users']
+        users = ShoppingListItem.objects.all()
+        if active:
+            users = users.filter(user__is_active=True)
+        total = users.values('user_id').distinct().count()
+        started = reported = time.perf_counter()
+        done = failed = 0
+        # spawn: процессы запускаются по ходу выгрузки и не должны
+        # унаследовать соединение с БД, через которое читаются списки.
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        ) as pool:
+            pending = set()
+            for user_id, username, items in get_buy_lists(active):
+                pending.add(pool.submit(
+                    export_buy_list, directory, format, user_id, username,
+                    items,
+                ))
+                if len(pending) < options['workers'] * 4:
+                    continue
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    if future.exception() is not None:
+                        failed += 1
+                        self.stderr.write(repr(future.exception()))
+                    done += 1
+                if time.perf_counter() - reported >= PROGRESS_INTERVAL:
+                    self.report(done, total, started)
+                    reported = time.perf_counter()
+            for future in pending:
+                if future.exception() is not None:
+                    failed += 1
+                    self.stderr.write(repr(future.exception()))
+                done += 1
+        self.report(done, total, started)
+        self.stdout.write(self.style.SUCCESS(
+            f'{done - failed} {format} files written to {directory},'
+            f' {failed} failed'
+        ))
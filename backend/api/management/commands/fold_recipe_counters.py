@@ -0,0 +1,61 @@
+import time
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+
+from api.counters import FOLD_CHUNK_SIZE, fold_counters, reconcile_counters
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Сворачивает шарды счётчиков в Recipe.favorites_count/cart_count;'
+        ' с --reconcile сверяет счётчики с избранным и корзинами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reconcile',
+            action='store_true',
+            help='Пересчитать счётчики по Favorite и ShoppingList',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='С --reconcile: только показать расхождения',
+        )
+
+    def reconcile(self, fix):
+        recipe_ids = list(
+            Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        )
+        drift = Counter()
+        for start in range(0, len(recipe_ids), FOLD_CHUNK_SIZE):
+            drift.update(reconcile_counters(
+                recipe_ids[start:start + FOLD_CHUNK_SIZE], fix=fix
+            ))
+        summary = (
+            f'{len(recipe_ids)} recipes checked:'
+            f' {drift["favorites_count"]} favorites counters,'
+            f' {drift["cart_count"]} cart counters wrong'
+        )
+        if not sum(drift.values()):
+            self.stdout.write(self.style.SUCCESS(summary))
+        else:
+            self.stdout.write(self.style.WARNING(
+                summary + ('' if not fix else ' (fixed)')
+            ))
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        if options['dry_run'] and not options['reconcile']:
+            self.stderr.write('--dry-run needs --reconcile')
+            return
+        if not options['dry_run']:
+            folded = fold_counters()
+            self.stdout.write(
+                f'{folded} shards folded'
+                f' in {time.perf_counter() - started:.2f} s'
+            )
+        if options['reconcile']:
+            self.reconcile(fix=not options['dry_run'])
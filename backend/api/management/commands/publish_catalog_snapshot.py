@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.snapshot import publish_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Публикация снимка справочника для воркеров gunicorn'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            type=str,
+            default=settings.CATALOG_SNAPSHOT_PATH,
+            help='Путь к файлу снимка (по умолчанию CATALOG_SNAPSHOT_PATH)',
+        )
+
+    def handle(self, *args, **options):
+        if not options['path']:
+            raise CommandError('CATALOG_SNAPSHOT_PATH is not set')
+        versions = publish_snapshot(options['path'])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Snapshot published to {options["path"]}: {versions}'
+            )
+        )
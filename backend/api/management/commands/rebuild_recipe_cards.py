@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from api.cache import bump_version
+from api.serializers import refresh_recipe_cards
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересборка карточек и масок тегов рецептов'
+        ' (Recipe.card, Recipe.tags_mask)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--missing',
+            action='store_true',
+            help='Только рецепты без карточки',
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.only('id').order_by('id')
+        if options['missing']:
+            recipes = recipes.filter(card={})
+        total = recipes.count()
+        refresh_recipe_cards(recipes.iterator())
+        bump_version('recipe_fragments')
+        self.stdout.write(self.style.SUCCESS(f'{total} recipe cards rebuilt'))
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.jobs import ACTIVE_STATUSES, run_job
+from recipes.models import ShoppingListJob
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет задания на списки покупок из очереди в текущем процессе'
+        ' и удаляет старые завершённые задания'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-days',
+            type=int,
+            default=7,
+            help='Сколько дней хранить завершённые задания',
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        ShoppingListJob.objects.filter(
+            status=ShoppingListJob.RUNNING,
+            started__lt=now - timedelta(seconds=settings.REPORT_JOB_TIMEOUT),
+        ).update(status=ShoppingListJob.PENDING)
+        done = 0
+        for job_id in ShoppingListJob.objects.filter(
+            status=ShoppingListJob.PENDING
+        ).values_list('id', flat=True):
+            run_job(job_id)
+            done += 1
+        deleted, _ = ShoppingListJob.objects.exclude(
+            status__in=ACTIVE_STATUSES
+        ).filter(
+            created__lt=now - timedelta(days=options['keep_days'])
+        ).delete()
+        self.stdout.write(
+            self.style.SUCCESS(f'{done} jobs processed, {deleted} deleted')
+        )
@@ -0,0 +1,44 @@
+from django.core.cache import cache
+
+METRIC_KEY = 'metrics:{}'
+COUNTERS = (
+    'recipe_fragments.hits',
+    'recipe_fragments.misses',
+    'recipes.conditional',
+    'recipes.not_modified',
+    'shopping_lists.hits',
+    'shopping_lists.misses',
+    'report_jobs.enqueued',
+    'report_jobs.done',
+    'report_jobs.failed',
+    'report_jobs.render_ms',
+)
+
+
+def incr(name, delta=1):
+    """Счётчик в общем кэше, чтобы значения суммировались по воркерам."""
+    if not delta:
+        return
+    key = METRIC_KEY.format(name)
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        if not cache.add(key, delta, timeout=None):
+            cache.incr(key, delta)
+
+
+def get_metrics():
+    values = cache.get_many([METRIC_KEY.format(name) for name in COUNTERS])
+    metrics = {
+        name: values.get(METRIC_KEY.format(name), 0) for name in COUNTERS
+    }
+    for name in COUNTERS:
+        if not name.endswith('.hits'):
+            continue
+        prefix = name[:-len('.hits')]
+        hits = metrics[name]
+        total = hits + metrics[f'{prefix}.misses']
+        metrics[f'{prefix}.hit_rate'] = (
+            round(hits / total, 4) if total else None
+        )
+    return metrics
@@ -12,5 +12,5 @@ class IsOwnerOrStaffOrReadOnly(permissions.BasePermission):
 
 def check_object_permissions(request, obj):
     return (request.method in permissions.SAFE_METHODS) or (
-            obj.author == request.user or request.user.is_superuser
+            obj.author_id == request.user.id or request.user.is_superuser
     )
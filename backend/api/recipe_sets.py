@@ -0,0 +1,58 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from recipes.models import Favorite, ShoppingList
+
+RECIPE_SET_KEY = 'recipe_ids:{}:{}:{}'
+VIEWER_STAMP_KEY = 'viewer_modified:{}'
+RECIPE_SET_MODELS = {
+    'favorites': Favorite,
+    'shopping_cart': ShoppingList,
+}
+
+
+def get_recipe_set_key(name, user_id, stamp):
+    return RECIPE_SET_KEY.format(name, user_id, stamp)
+
+
+def get_recipe_ids(user, name):
+    """Множество id рецептов пользователя в избранном ('favorites') или
+    корзине ('shopping_cart') из кэша; при промахе - один запрос к БД.
+
+    Ключ включает отметку пользователя (get_viewer_stamp), которая
+    сдвигается после фиксации каждого изменения. Множество, прочитанное
+    до коммита, ложится под старый ключ, и его больше никто не читает."""
+    key = get_recipe_set_key(name, user.id, get_viewer_stamp(user.id))
+    recipe_ids = cache.get(key)
+    if recipe_ids is None:
+        recipe_ids = frozenset(
+            RECIPE_SET_MODELS[name].objects.filter(user=user).values_list(
+                'recipe_id', flat=True
+            )
+        )
+        cache.set(key, recipe_ids, settings.RECIPE_SET_TIMEOUT)
+    return recipe_ids
+
+
+def get_viewer_stamp(user_id):
+    """Время последнего изменения избранного, корзины или подписок
+    пользователя (unix time). Если отметки в кэше нет, ею становится
+    текущее время: всё, что менялось раньше, она покрывает."""
+    key = VIEWER_STAMP_KEY.format(user_id)
+    stamp = cache.get(key)
+    if stamp is None:
+        cache.add(key, time.time(), timeout=None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def touch_viewer(user_id):
+    """Сдвигает отметку пользователя после фиксации транзакции: это
+    меняет ETag его страниц и ключи его множеств id."""
+    key = VIEWER_STAMP_KEY.format(user_id)
+    transaction.on_commit(
+        lambda: cache.set(key, time.time(), timeout=None)
+    )
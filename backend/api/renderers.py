@@ -0,0 +1,113 @@
+import abc
+import csv
+
+from rest_framework.renderers import JSONRenderer
+
+from api.report import (
+    REPORT_BACKENDS, get_shopping_list_text, get_shopping_list_title,
+    write_shopping_list,
+)
+from api.utils import stream_json_array
+
+SHOPPING_LIST_CSV_HEADER = ('name', 'measurement_unit', 'amount')
+
+
+class Echo:
+    """Файлоподобный объект для csv.writer: write возвращает строку."""
+
+    def write(self, value):
+        return value
+
+
+class ShoppingListRenderer(JSONRenderer):
+    """Формат выгрузки списка покупок, выбирается по Accept или ?format=.
+
+    Сам список view отдаёт мимо render: отчётом движка или потоком
+    stream(). render нужен только ответам DRF без списка (ошибки,
+    задания) и отдаёт их как JSON.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        response = (renderer_context or {}).get('response')
+        if response is not None:
+            response['Content-Type'] = 'application/json'
+        return super().render(data, 'application/json', renderer_context)
+
+
+class ShoppingListStreamRenderer(abc.ABC, ShoppingListRenderer):
+    """Формат, который отдаётся потоком строк по позициям списка."""
+
+    @abc.abstractmethod
+    def stream(self, items, username):
+        """Строки выгрузки позиций items (словари get_buy_list_queryset)
+        пользователя username."""
+
+
+class ShoppingListPDFRenderer(ShoppingListRenderer):
+    """Отчёт движком SHOPPING_LIST_REPORT_BACKEND (по умолчанию PDF)."""
+
+    media_type = 'application/pdf'
+    format = 'pdf'
+    charset = None
+
+
+class ShoppingListTextRenderer(ShoppingListStreamRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+
+    def stream(self, items, username):
+        return REPORT_BACKENDS['text'].iter_text(
+            (get_shopping_list_text(**item) for item in items),
+            get_shopping_list_title(username),
+        )
+
+
+class ShoppingListCSVRenderer(ShoppingListStreamRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+
+    def stream(self, items, username):
+        writer = csv.writer(Echo())
+        yield writer.writerow(SHOPPING_LIST_CSV_HEADER)
+        for item in items:
+            yield writer.writerow((
+                item['ingredient__name'],
+                item['ingredient__measurement_unit__name'],
+                item['amount'],
+            ))
+
+
+class ShoppingListJSONRenderer(ShoppingListStreamRenderer):
+    def stream(self, items, username):
+        return stream_json_array(
+            {
+                'name': item['ingredient__name'],
+                'measurement_unit': item['ingredient__measurement_unit__name'],
+                'amount': item['amount'],
+            }
+            for item in items
+        )
+
+
+# Первый формат - ответ по умолчанию (Accept: */*).
+SHOPPING_LIST_RENDERERS = (
+    ShoppingListPDFRenderer,
+    ShoppingListTextRenderer,
+    ShoppingListCSVRenderer,
+    ShoppingListJSONRenderer,
+)
+
+
+def write_buy_list(items, username, format, output):
+    """Сводный список в формате format (pdf, txt, csv, json) в открытый
+    на запись двоичный файл output; pdf - отчёт движком
+    SHOPPING_LIST_REPORT_BACKEND."""
+    if format == ShoppingListPDFRenderer.format:
+        write_shopping_list(items, username, output)
+        return
+    renderer = next(
+        renderer for renderer in SHOPPING_LIST_RENDERERS
+        if renderer.format == format
+    )
+    for chunk in renderer().stream(items, username):
+        output.write(chunk.encode('utf-8'))
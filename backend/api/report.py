@@ -1,9 +1,13 @@
-import io
+import abc
+import threading
 
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from reportlab.lib.colors import Color
 from reportlab.lib.pagesizes import A4
-from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
 from reportlab.lib.units import cm, inch
+from reportlab.lib.utils import simpleSplit
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
@@ -12,42 +16,85 @@ from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Spacer
 w, h = A4
 PAGE_HEIGHT = h
 PAGE_WIDTH = w
+FONT_NAME = 'DejaVuSerif'
+PAGE_NUMBER_FONT = 'Times-Roman'
+PAGE_NUMBER_FONT_SIZE = 9
+PAGE_COUNT_FORM = 'page_count'
+PAGE_COUNT_WIDTH = pdfmetrics.stringWidth(
+    '0000', PAGE_NUMBER_FONT, PAGE_NUMBER_FONT_SIZE
+)
+
+_setup_lock = threading.Lock()
+_styles = {}
+
+
+def register_font():
+    """Регистрирует шрифт отчёта (PDF_FONT_PATH) один раз на процесс:
+    разобранный TTF остаётся в реестре reportlab и переиспользуется
+    всеми документами."""
+    if FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return FONT_NAME
+    with _setup_lock:
+        if FONT_NAME not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont(FONT_NAME, settings.PDF_FONT_PATH))
+    return FONT_NAME
+
+
+def get_paragraph_style():
+    """Стиль строк списка покупок, создаётся один раз на процесс."""
+    style = _styles.get('item')
+    if style is None:
+        style = ParagraphStyle(
+            'ShoppingListItem',
+            parent=getSampleStyleSheet()['Normal'],
+            fontName=register_font(),
+        )
+        _styles['item'] = style
+    return style
 
 
 class NumberedCanvas(canvas.Canvas):
-    def __init__(self, *args, **kwargs):
-        canvas.Canvas.__init__(self, *args, **kwargs)
-        self._saved_page_states = []
+    """Холст с нумерацией "Page x of y".
+
+    Общее число страниц рисуется form XObject, который определяется в
+    save(), когда оно уже известно, а на каждой странице только
+    упоминается. Поэтому состояние страниц не копируется и память не
+    растёт с размером документа.
+    """
 
     def showPage(self):
-        self._saved_page_states.append(dict(self.__dict__))
-        self._startPage()
+        self.draw_page_number()
+        canvas.Canvas.showPage(self)
 
     def save(self):
-        """add page info to each page (page x of y)"""
-        num_pages = len(self._saved_page_states)
-        for state in self._saved_page_states:
-            self.__dict__.update(state)
-            self.draw_page_number(num_pages)
-            canvas.Canvas.showPage(self)
+        if len(self._code):
+            self.showPage()
+        self.beginForm(PAGE_COUNT_FORM)
+        self.set_page_number_style()
+        self.drawString(0, 0, str(self._pageNumber - 1))
+        self.endForm()
         canvas.Canvas.save(self)
 
-    def draw_page_number(self, page_count):
-        self.setFont('Times-Roman', 9)
+    def set_page_number_style(self):
+        self.setFont(PAGE_NUMBER_FONT, PAGE_NUMBER_FONT_SIZE)
+        self.setFillColor(Color(0, 0, 0, alpha=0.4))
+
+    def draw_page_number(self):
+        self.saveState()
+        self.set_page_number_style()
         self.setLineWidth(0.1)
         self.setStrokeColor(Color(0, 0, 0, alpha=0.2))
-        self.setFillColor(Color(0, 0, 0, alpha=0.4))
         self.line(cm, 1.5 * cm, A4[0] - cm, 1.5 * cm)
-        self.drawRightString(
-            A4[0] - cm,
-            1.1 * cm,
-            "Page %d of %d" % (self._pageNumber, page_count),
-        )
+        x = A4[0] - cm - PAGE_COUNT_WIDTH
+        self.drawRightString(x, 1.1 * cm, 'Page %d of ' % self._pageNumber)
+        self.translate(x, 1.1 * cm)
+        self.doForm(PAGE_COUNT_FORM)
+        self.restoreState()
 
 
 def my_first_page(canvas, doc):
     canvas.saveState()
-    canvas.setFont('DejaVuSerif', 15)
+    canvas.setFont(FONT_NAME, 15)
     canvas.drawCentredString(PAGE_WIDTH / 2.0, PAGE_HEIGHT - 38, doc.title)
     doc.afterPage()
     canvas.restoreState()
@@ -55,7 +102,7 @@ def my_first_page(canvas, doc):
 
 def my_later_pages(canvas, doc):
     canvas.saveState()
-    canvas.setFont('DejaVuSerif', 9)
+    canvas.setFont(FONT_NAME, 9)
     canvas.restoreState()
 
 
@@ -68,29 +115,121 @@ def get_shopping_list_text(
     )
 
 
-def create_pdf_from_queryset(queryset, username):
-    pdf_file = io.BytesIO()
-    ru_style = getSampleStyleSheet()['Normal']
-    ru_style.fontName = 'DejaVuSerif'
-    doc = SimpleDocTemplate(
-        pdf_file,
-        leftMargin=0.75 * inch,
-        rightMargin=0.75 * inch,
-        topMargin=1 * inch,
-        bottomMargin=1 * inch,
-    )
-    pdfmetrics.registerFont(TTFont('DejaVuSerif', 'DejaVuSerif.ttf', 'UTF-8'))
-    doc.title = f'Список покупок для {username}'
-    story = [Spacer(2.5, 0.75 * inch)]
-    for items in queryset:
-        story.append(Paragraph(get_shopping_list_text(**items), ru_style))
-
-    story.append(PageBreak())
-    doc.build(
-        story,
-        onFirstPage=my_first_page,
-        onLaterPages=my_later_pages,
-        canvasmaker=NumberedCanvas,
+class ReportBackend(abc.ABC):
+    """Движок отчёта: пишет заголовок и строки в открытый на запись
+    двоичный файл."""
+
+    name = None
+    media_type = None
+    extension = None
+
+    @abc.abstractmethod
+    def write(self, lines, title, output):
+        pass
+
+
+class CanvasBackend(ReportBackend):
+    """PDF прямо на холсте, по мере чтения lines: без списка flowables
+    платипуса и без хранения строк."""
+
+    name = 'canvas'
+    media_type = 'application/pdf'
+    extension = 'pdf'
+
+    def write(self, lines, title, output):
+        font_name = register_font()
+        style = get_paragraph_style()
+        leading, font_size = style.leading, style.fontSize
+        left, width = 0.75 * inch, PAGE_WIDTH - 1.5 * inch
+        top, bottom = PAGE_HEIGHT - 1 * inch, 1 * inch
+        pdf = NumberedCanvas(output, pagesize=A4, pageCompression=1)
+        pdf.setTitle(title)
+        pdf.setFont(font_name, 15)
+        pdf.drawCentredString(PAGE_WIDTH / 2.0, PAGE_HEIGHT - 38, title)
+        y = top - 0.75 * inch
+        pdf.setFont(font_name, font_size)
+        for line in lines:
+            for part in simpleSplit(line, font_name, font_size, width):
+                if y < bottom:
+                    pdf.showPage()
+                    pdf.setFont(font_name, font_size)
+                    y = top
+                pdf.drawString(left, y, part)
+                y -= leading
+        pdf.save()
+
+
+class PlatypusBackend(ReportBackend):
+    """PDF из абзацев платипуса: вёрстка медленнее, зато строки
+    переносятся и разбиваются на страницы по правилам reportlab."""
+
+    name = 'platypus'
+    media_type = 'application/pdf'
+    extension = 'pdf'
+
+    def write(self, lines, title, output):
+        style = get_paragraph_style()
+        doc = SimpleDocTemplate(
+            output,
+            leftMargin=0.75 * inch,
+            rightMargin=0.75 * inch,
+            topMargin=1 * inch,
+            bottomMargin=1 * inch,
+        )
+        doc.title = title
+        story = [Spacer(2.5, 0.75 * inch)]
+        story.extend(Paragraph(line, style) for line in lines)
+        story.append(PageBreak())
+        doc.build(
+            story,
+            onFirstPage=my_first_page,
+            onLaterPages=my_later_pages,
+            canvasmaker=NumberedCanvas,
+        )
+
+
+class TextBackend(ReportBackend):
+    name = 'text'
+    media_type = 'text/plain'
+    extension = 'txt'
+
+    def iter_text(self, lines, title):
+        yield f'{title}\n\n'
+        for line in lines:
+            yield line + '\n'
+
+    def write(self, lines, title, output):
+        for chunk in self.iter_text(lines, title):
+            output.write(chunk.encode('utf-8'))
+
+
+REPORT_BACKENDS = {
+    backend.name: backend()
+    for backend in (CanvasBackend, PlatypusBackend, TextBackend)
+}
+
+
+def get_report_backend(name=None):
+    """Движок по имени, по умолчанию SHOPPING_LIST_REPORT_BACKEND."""
+    name = name or settings.SHOPPING_LIST_REPORT_BACKEND
+    try:
+        return REPORT_BACKENDS[name]
+    except KeyError:
+        raise ImproperlyConfigured(
+            f'Неизвестный движок отчёта {name!r}, доступны:'
+            f' {", ".join(REPORT_BACKENDS)}'
+        ) from None
+
+
+def get_shopping_list_title(username):
+    return f'Список покупок для {username}'
+
+
+def write_shopping_list(items, username, output, backend=None):
+    """Отчёт по готовому сводному списку (словари как у buy_list) в
+    открытый на запись файл output."""
+    get_report_backend(backend).write(
+        (get_shopping_list_text(**item) for item in items),
+        get_shopping_list_title(username),
+        output,
     )
-    pdf_file.seek(0)
-    return pdf_file
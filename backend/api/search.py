@@ -0,0 +1,308 @@
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import Counter, namedtuple
+from math import ceil
+
+from django.conf import settings
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection, transaction
+from django.db.models import (
+    Case, CharField, F, FloatField, Func, Q, Value, When,
+)
+
+from api.cache import get_version
+from recipes.models import Ingredient
+
+SEPARATOR = '\n'
+MERGE_CHUNK = 512
+CUT_OFF_CANDIDATES = 10
+WORD_RE = re.compile(r'\w+')
+
+IndexState = namedtuple(
+    'IndexState',
+    ('rows', 'by_prefix', 'keys', 'haystack', 'offsets', 'trigrams', 'sizes'),
+)
+
+
+def normalize(string):
+    """Приведение к нижнему регистру и замена ё на е, если включено
+    FUZZY_SEARCH_NORMALIZE."""
+    if not settings.FUZZY_SEARCH_NORMALIZE:
+        return string
+    return string.lower().replace('ё', 'е')
+
+
+def get_trigrams(string):
+    """Триграммы строки по правилам pg_trgm: каждое слово дополняется
+    двумя пробелами слева и одним справа."""
+    trigrams = set()
+    for word in WORD_RE.findall(string.lower()):
+        word = f'  {word} '
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def ingredient_search_queryset(string):
+    """Поиск ингредиентов средствами БД: сначала совпадения по началу
+    названия, затем по вхождению, внутри групп - по названию."""
+    return (
+        Ingredient.objects.select_related('measurement_unit')
+        .filter(Q(name__istartswith=string) | Q(name__icontains=string))
+        .annotate(
+            k1=Case(
+                When(name__istartswith=string, then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            k2=Case(
+                When(name__icontains=string, then=Value(1.0)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            ),
+            rank=F("k1") + F("k2"),
+        )
+        .distinct()
+        .order_by('-rank', 'name')
+    )
+
+
+def fuzzy_search_queryset(string):
+    """Нечёткий поиск по триграммам на PostgreSQL (pg_trgm, индекс из
+    миграции recipes.0002)."""
+    name = F('name')
+    if settings.FUZZY_SEARCH_NORMALIZE:
+        name = Func(
+            name,
+            Value('ёЁ'),
+            Value('еЕ'),
+            function='TRANSLATE',
+            output_field=CharField(),
+        )
+    return (
+        Ingredient.objects.alias(search_name=name)
+        .filter(search_name__trigram_similar=normalize(string))
+        .annotate(similarity=TrigramSimilarity(name, normalize(string)))
+        .order_by('-similarity', 'name')
+    )
+
+
+def fuzzy_search_ingredients(string):
+    """Нечёткий поиск ингредиентов, отсортированный по похожести."""
+    if connection.vendor != 'postgresql':
+        return ingredient_index.fuzzy_search(string)
+
+    # Порог оператора % задаётся через SET LOCAL: он действует до конца
+    # транзакции и не остаётся на соединении для следующих запросов.
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SET LOCAL pg_trgm.similarity_threshold = %s',
+                (settings.FUZZY_SEARCH_THRESHOLD,),
+            )
+        queryset = fuzzy_search_queryset(string).values_list(
+            'id', 'name', 'measurement_unit__name'
+        )[:settings.FUZZY_SEARCH_LIMIT]
+        return [
+            {'id': pk, 'name': name, 'measurement_unit': unit}
+            for pk, name, unit in queryset
+        ]
+
+
+class IngredientIndex:
+    """Индекс ингредиентов в памяти процесса для автодополнения.
+
+    Строится один раз из Ingredient + Unit и перестраивается при смене
+    версии 'ingredients' (см. recipes.signals). Ранжирование search
+    совпадает с ingredient_search_queryset, fuzzy_search - запасной
+    вариант fuzzy_search_queryset для SQLite.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._frozen = False
+        self._state = self.build_state(())
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Индекс по готовым строкам (id, name, measurement_unit),
+        отсортированным по name, без обращения к БД и отслеживания версии."""
+        index = cls()
+        index._state = cls.build_state(rows)
+        index._frozen = True
+        return index
+
+    def _build(self):
+        self._state = self.build_state(
+            Ingredient.objects.order_by('name', 'id').values_list(
+                'id', 'name', 'measurement_unit__name'
+            )
+        )
+
+    @staticmethod
+    def build_state(rows):
+        rows = tuple(
+            {
+                'id': pk,
+                'name': name,
+                'measurement_unit': unit,
+            }
+            for pk, name, unit in rows
+        )
+        lowered = [row['name'].lower() for row in rows]
+        by_prefix = sorted(range(len(rows)), key=lambda pos: lowered[pos])
+        offsets, offset = [], 0
+        for key in lowered:
+            offsets.append(offset)
+            offset += len(key) + len(SEPARATOR)
+
+        trigrams, sizes = {}, array('H')
+        for pos, row in enumerate(rows):
+            row_trigrams = get_trigrams(normalize(row['name']))
+            sizes.append(len(row_trigrams))
+            for trigram in row_trigrams:
+                trigrams.setdefault(trigram, array('I')).append(pos)
+
+        return IndexState(
+            rows,
+            tuple(by_prefix),
+            tuple(lowered[pos] for pos in by_prefix),
+            SEPARATOR.join(lowered),
+            tuple(offsets),
+            trigrams,
+            sizes,
+        )
+
+    def refresh(self):
+        if self._frozen:
+            return
+        version = get_version('ingredients')
+        if version == self._version:
+            return
+        with self._lock:
+            if version != self._version:
+                self._build()
+                self._version = version
+
+    @staticmethod
+    def _prefix_positions(by_prefix, keys, key):
+        start = bisect_left(keys, key)
+        end = bisect_right(keys, key + '\U0010ffff', lo=start)
+        return by_prefix[start:end]
+
+    @staticmethod
+    def _substring_positions(haystack, offsets, key):
+        positions = []
+        found = haystack.find(key)
+        while found != -1:
+            pos = bisect_right(offsets, found) - 1
+            positions.append(pos)
+            found = haystack.find(key, offsets[pos + 1]) if (
+                pos + 1 < len(offsets)
+            ) else -1
+        return positions
+
+    def search(self, string):
+        self.refresh()
+        state = self._state
+        key = string.lower().replace(SEPARATOR, '')
+        if not key:
+            return list(state.rows)
+        prefix = sorted(
+            self._prefix_positions(state.by_prefix, state.keys, key)
+        )
+        seen = set(prefix)
+        substring = [
+            pos
+            for pos in self._substring_positions(
+                state.haystack, state.offsets, key
+            )
+            if pos not in seen
+        ]
+        return [state.rows[pos] for pos in prefix + substring]
+
+    def fuzzy_search(self, string, limit=None, threshold=None, budget=None):
+        """Поиск по похожести триграмм (как similarity() в pg_trgm).
+
+        Списки вхождений обходятся от редких триграмм к частым. Новых
+        кандидатов дают только первые списки (префиксный фильтр: строка с
+        похожестью не ниже threshold обязана встретиться хотя бы в одном
+        из них), по остальным счётчики кандидатов досчитываются бинарным
+        поиском. По истечении budget (мс) слияние прекращается и
+        досчитываются только limit * CUT_OFF_CANDIDATES лучших
+        кандидатов, так что похожесть всегда считается по полному числу
+        общих триграмм.
+        """
+        self.refresh()
+        state = self._state
+        limit = limit or settings.FUZZY_SEARCH_LIMIT
+        threshold = (
+            settings.FUZZY_SEARCH_THRESHOLD if threshold is None else threshold
+        )
+        budget = settings.FUZZY_SEARCH_BUDGET_MS if budget is None else budget
+        deadline = time.perf_counter() + budget / 1000
+
+        query = get_trigrams(normalize(string))
+        postings = sorted(
+            (state.trigrams[trigram] for trigram in query
+             if trigram in state.trigrams),
+            key=len,
+        )
+        needed = max(ceil(threshold * len(query)), 1)
+        prefix = max(len(postings) - needed + 1, 0)
+        shared = Counter()
+        rest = [(posting, 0) for posting in postings[prefix:]]
+        cut_off = False
+        for number, posting in enumerate(postings[:prefix]):
+            for start in range(0, len(posting), MERGE_CHUNK):
+                shared.update(posting[start:start + MERGE_CHUNK])
+                if time.perf_counter() > deadline:
+                    cut_off = True
+                    rest = [(posting, start + MERGE_CHUNK)] + [
+                        (other, 0) for other in postings[number + 1:]
+                    ]
+                    break
+            if cut_off:
+                break
+
+        # Если каждый оставшийся список добавит по общей триграмме, то при
+        # common общих похожесть не ниже threshold только у строк не
+        # длиннее max_sizes[common] триграмм.
+        sizes = state.sizes
+        max_sizes = [
+            top + top / threshold - len(query) + 1e-9 if threshold
+            else float('inf')
+            for top in (
+                min(common + len(rest), len(query))
+                for common in range(prefix + 1)
+            )
+        ]
+        candidates = [
+            pos for pos, common in shared.items()
+            if sizes[pos] <= max_sizes[common]
+        ]
+        if cut_off:
+            candidates = heapq.nlargest(
+                limit * CUT_OFF_CANDIDATES,
+                candidates,
+                key=lambda pos: (shared[pos], -sizes[pos]),
+            )
+
+        scored = []
+        for pos in candidates:
+            common = shared[pos]
+            for posting, start in rest:
+                found = bisect_left(posting, pos, start)
+                if found < len(posting) and posting[found] == pos:
+                    common += 1
+            similarity = common / (len(query) + sizes[pos] - common)
+            if similarity >= threshold:
+                scored.append((-similarity, pos))
+        return [state.rows[pos] for _, pos in heapq.nsmallest(limit, scored)]
+
+
+ingredient_index = IngredientIndex()
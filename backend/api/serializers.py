@@ -1,11 +1,17 @@
+import threading
+
 from django.db import transaction
+from django.utils import timezone
 from drf_extra_fields.fields import Base64ImageField
 from rest_framework import serializers
 
-from api.utils import create_recipe_ingredients
+from api.shopping_items import track_recipe_amounts
+from api.utils import create_recipe_ingredients, with_recipe_relations
 from recipes.models import Ingredient, Recipe, Tag
 from users.serializers import UserBaseSerializer
 
+_pending_cards = threading.local()
+
 
 class RecipeFavoriteSerializer(serializers.BaseSerializer):
     def to_representation(self, instance):
@@ -50,6 +56,83 @@ class RecipeIngredientSerializer(serializers.BaseSerializer):
         }
 
 
+class RecipeCardSerializer(serializers.BaseSerializer):
+    """Не зависящая от пользователя часть рецепта, хранится в Recipe.card."""
+
+    def to_representation(self, instance):
+        try:
+            image = instance.image.url
+        except ValueError:
+            image = ''
+
+        return {
+            'id': instance.id,
+            'name': instance.name,
+            'text': instance.text,
+            'image': image,
+            'cooking_time': instance.cooking_time,
+            'tags': TagSerializer(instance.tags.all(), many=True).data,
+            'author': UserBaseSerializer.get_user_data(instance.author),
+            'ingredients': RecipeIngredientSerializer(
+                instance.recipe_ingredient.all(), many=True
+            ).data,
+        }
+
+
+def refresh_recipe_cards(recipes, batch_size=500):
+    """Пересобирает Recipe.card и Recipe.tags_mask для рецептов
+    (экземпляры или queryset) по данным из БД, сдвигает Recipe.modified и
+    обновляет эти поля у переданных экземпляров."""
+    instances = {}
+    for recipe in recipes:
+        instances[recipe.pk] = recipe
+        if len(instances) >= batch_size:
+            _refresh_cards(instances)
+            instances = {}
+    if instances:
+        _refresh_cards(instances)
+
+
+def get_pending_cards():
+    if not hasattr(_pending_cards, 'recipe_ids'):
+        _pending_cards.recipe_ids = set()
+    return _pending_cards.recipe_ids
+
+
+def refresh_recipe_cards_on_commit(recipe_ids):
+    """Пересобирает карточки рецептов recipe_ids после фиксации
+    транзакции. Id копятся до коммита: рецепт пересобирается один раз,
+    сколько бы его строк RecipeTag и RecipeIngredient ни изменилось, и не
+    пересобирается, если refresh_recipe_cards уже сделал это позже."""
+    get_pending_cards().update(recipe_ids)
+    transaction.on_commit(refresh_pending_cards)
+
+
+def refresh_pending_cards():
+    pending = get_pending_cards()
+    recipe_ids = list(pending)
+    pending.clear()
+    if recipe_ids:
+        refresh_recipe_cards(Recipe.objects.filter(pk__in=recipe_ids))
+
+
+def _refresh_cards(instances):
+    recipes = list(
+        with_recipe_relations(Recipe.objects.filter(pk__in=instances))
+    )
+    modified = timezone.now()
+    for recipe in recipes:
+        recipe.card = RecipeCardSerializer(recipe).data
+        recipe.tags_mask = Tag.get_mask(recipe.tags.all())
+        recipe.modified = modified
+        instance = instances[recipe.pk]
+        instance.card, instance.tags_mask, instance.modified = (
+            recipe.card, recipe.tags_mask, recipe.modified
+        )
+    Recipe.objects.bulk_update(recipes, ('card', 'tags_mask', 'modified'))
+    get_pending_cards().difference_update(instances)
+
+
 class RecipeSerializer(serializers.BaseSerializer):
     def validate(self, data):
         param = (
@@ -107,41 +190,39 @@ class RecipeSerializer(serializers.BaseSerializer):
         validated_data['image'] = image_file
         return validated_data
 
-    def to_representation(self, instance):
+    def get_user_flag(self, instance, name, records):
         user = self.context['request'].user
-        is_favorited = (
-            False
-            if user.is_anonymous
-            else instance.in_favorite.filter(user_id=user.id).exists()
-        )
-        is_in_shopping_cart = (
-            False
-            if user.is_anonymous
-            else instance.in_shopping_list.filter(user_id=user.id).exists()
-        )
-        tags = instance.tags.all()
-        tags_serializer = TagSerializer(tags, many=True)
-        author = instance.author
-        author_serializer = UserBaseSerializer(author, context=self.context)
-        ingredients_serializer = RecipeIngredientSerializer(
-            instance.recipe_ingredient.all(), many=True
+        if user.is_anonymous:
+            return False
+        recipe_ids = self.context.get(name)
+        if recipe_ids is not None:
+            return instance.id in recipe_ids
+        return records.filter(user_id=user.id).exists()
+
+    def to_representation(self, instance):
+        card = self.context.get('fragments', {}).get(instance.id) or (
+            instance.card or RecipeCardSerializer(instance).data
         )
-        try:
-            image = instance.image.url
-        except ValueError:
-            image = ''
+        author = dict(card['author'])
+        author['is_subscribed'] = UserBaseSerializer(
+            context=self.context
+        ).get_is_subscribed(author['id'])
 
         return {
-            'id': instance.id,
-            'name': instance.name,
-            'text': instance.text,
-            'image': image,
-            'cooking_time': instance.cooking_time,
-            'is_favorited': is_favorited,
-            'is_in_shopping_cart': is_in_shopping_cart,
-            'tags': tags_serializer.data,
-            'author': author_serializer.data,
-            'ingredients': ingredients_serializer.data,
+            'id': card['id'],
+            'name': card['name'],
+            'text': card['text'],
+            'image': card['image'],
+            'cooking_time': card['cooking_time'],
+            'is_favorited': self.get_user_flag(
+                instance, 'favorites', instance.in_favorite
+            ),
+            'is_in_shopping_cart': self.get_user_flag(
+                instance, 'shopping_cart', instance.in_shopping_list
+            ),
+            'tags': card['tags'],
+            'author': author,
+            'ingredients': card['ingredients'],
         }
 
     @transaction.atomic
@@ -151,14 +232,16 @@ class RecipeSerializer(serializers.BaseSerializer):
             instance.tags.set(tags)
 
         ingredients = validated_data.pop('ingredients', None)
-        if ingredients is not None:
-            instance.ingredients.clear()
-        create_recipe_ingredients(ingredients, instance)
+        with track_recipe_amounts(instance):
+            if ingredients is not None:
+                instance.ingredients.clear()
+            create_recipe_ingredients(ingredients, instance)
         instance.name = validated_data.get('name', instance.name)
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get('cooking_time', instance.cooking_time)
         instance.image = validated_data.get('image', instance.image)
         instance.save()
+        refresh_recipe_cards([instance])
         return instance
 
     @transaction.atomic
@@ -169,4 +252,5 @@ class RecipeSerializer(serializers.BaseSerializer):
         recipe = Recipe.objects.create(author=author, **validated_data)
         recipe.tags.set(tags_data)
         create_recipe_ingredients(ingredients_data, recipe)
+        refresh_recipe_cards([recipe])
         return recipe
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+from api import metrics
+from api.report import (
+    REPORT_BACKENDS, get_report_backend, write_shopping_list,
+)
+
+CACHE_FORMAT_VERSION = 1
+
+
+class FileCache:
+    """Файловый кэш с вытеснением давно не читавшихся файлов (LRU).
+
+    Время последнего чтения хранится в mtime файла. Запись атомарна
+    (временный файл и os.replace), поэтому кэш можно делить между
+    процессами. После каждой записи самые старые файлы удаляются, пока
+    общий размер каталога больше max_size.
+    """
+
+    def __init__(self, directory, max_size):
+        self.directory = directory
+        self.max_size = max_size
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def open(self, name):
+        """Открытый на чтение файл name или None, если его нет. Открытый
+        файл остаётся читаемым, даже если его тут же вытеснят."""
+        try:
+            cached = open(self.path(name), 'rb')
+        except FileNotFoundError:
+            return None
+        os.utime(cached.fileno())
+        return cached
+
+    def delete(self, name):
+        try:
+            os.unlink(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def put(self, name, write):
+        """Создаёт файл name, передавая открытый на запись файл в write,
+        и возвращает его открытым на чтение."""
+        os.makedirs(self.directory, exist_ok=True)
+        descriptor, tmp_path = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp'
+        )
+        try:
+            with os.fdopen(descriptor, 'wb') as output:
+                write(output)
+            os.replace(tmp_path, self.path(name))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        cached = open(self.path(name), 'rb')
+        self.evict(keep=name)
+        return cached
+
+    def evict(self, keep=None):
+        entries, total = [], 0
+        with os.scandir(self.directory) as scanner:
+            for entry in scanner:
+                if entry.name.endswith('.tmp') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.name))
+                total += stat.st_size
+        entries.sort()
+        for _, size, name in entries:
+            if total <= self.max_size:
+                break
+            if name != keep:
+                self.delete(name)
+                total -= size
+
+
+shopping_list_cache = FileCache(
+    settings.SHOPPING_LIST_CACHE_DIR, settings.SHOPPING_LIST_CACHE_MAX_SIZE
+)
+
+
+def get_cart_key(user):
+    """Хэш содержимого корзины: имя пользователя, id рецептов и их
+    Recipe.modified. Время изменения рецепта сдвигается при изменении
+    его ингредиентов и количеств, а также при переименовании
+    ингредиентов и единиц измерения (recipes.signals)."""
+    cart = user.shopping_list.order_by('recipe_id').values_list(
+        'recipe_id', 'recipe__modified'
+    )
+    state = [(pk, modified.isoformat()) for pk, modified in cart]
+    return hashlib.sha256(
+        repr((CACHE_FORMAT_VERSION, user.username, state)).encode()
+    ).hexdigest()
+
+
+def get_buy_list_queryset(user):
+    """Сводный список из ShoppingListItem: суммы по ингредиентам уже
+    посчитаны (api.shopping_items), остаётся прочитать строки
+    пользователя."""
+    return user.shopping_list_items.values(
+        'ingredient__name', 'ingredient__measurement_unit__name', 'amount'
+    ).order_by('ingredient__name')
+
+
+def aggregate_buy_list(user):
+    return list(get_buy_list_queryset(user))
+
+
+def get_buy_list(user, key=None):
+    """Сводный список покупок пользователя, из кэша по хэшу корзины."""
+    name = f'{key or get_cart_key(user)}.json'
+    cached = shopping_list_cache.open(name)
+    if cached is not None:
+        with cached:
+            return json.load(cached)
+    buy_list = aggregate_buy_list(user)
+    shopping_list_cache.put(
+        name,
+        lambda output: output.write(
+            json.dumps(buy_list, ensure_ascii=False).encode('utf-8')
+        ),
+    ).close()
+    return buy_list
+
+
+def get_shopping_list_report(user):
+    """Отчёт по списку покупок (SHOPPING_LIST_REPORT_BACKEND), открытый
+    на чтение: готовый файл из кэша или только что отрисованный."""
+    key = get_cart_key(user)
+    backend = get_report_backend()
+    name = f'{key}-{backend.name}.{backend.extension}'
+    cached = shopping_list_cache.open(name)
+    if cached is not None:
+        metrics.incr('shopping_lists.hits')
+        return cached
+    metrics.incr('shopping_lists.misses')
+    buy_list = get_buy_list(user, key)
+    return shopping_list_cache.put(
+        name,
+        lambda output: write_shopping_list(
+            buy_list, user.username, output, backend.name
+        ),
+    )
+
+
+def drop_shopping_list(user):
+    """Удаляет из кэша сводный список и отчёты текущей корзины."""
+    key = get_cart_key(user)
+    shopping_list_cache.delete(f'{key}.json')
+    for backend in REPORT_BACKENDS.values():
+        shopping_list_cache.delete(f'{key}-{backend.name}.{backend.extension}')
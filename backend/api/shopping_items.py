@@ -0,0 +1,192 @@
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.db.models import Sum
+
+from recipes.models import RecipeIngredient, ShoppingList, ShoppingListItem
+from users.models import User
+
+USERS_CHUNK_SIZE = 500
+
+_tracked = threading.local()
+
+
+def get_recipe_amounts(recipe_id):
+    return Counter(
+        dict(
+            RecipeIngredient.objects.filter(recipe_id=recipe_id).values_list(
+                'ingredient_id', 'amount'
+            )
+        )
+    )
+
+
+def lock_users(user_ids):
+    """Изменения сводного списка одного пользователя выполняются по
+    очереди: иначе две транзакции могут вставить одну и ту же позицию."""
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=user_ids)
+        .order_by('pk')
+        .values_list('pk', flat=True)
+    )
+
+
+def apply_shopping_delta(user_ids, delta):
+    """Прибавляет delta ({ingredient_id: количество}, бывает
+    отрицательным) к ShoppingListItem каждого из user_ids. Позиции с
+    нулевым количеством удаляются. Внутри внешней транзакции (клик по
+    корзине) точка сохранения не нужна: ошибка всё равно откатит её
+    целиком."""
+    delta = {pk: amount for pk, amount in delta.items() if amount}
+    if not delta:
+        return
+    user_ids = sorted(set(user_ids))
+    for start in range(0, len(user_ids), USERS_CHUNK_SIZE):
+        chunk = user_ids[start:start + USERS_CHUNK_SIZE]
+        with transaction.atomic(savepoint=False):
+            lock_users(chunk)
+            items = {
+                (item.user_id, item.ingredient_id): item
+                for item in ShoppingListItem.objects.filter(
+                    user_id__in=chunk, ingredient_id__in=delta
+                )
+            }
+            created, updated, deleted = [], [], []
+            for user_id in chunk:
+                for ingredient_id, amount in delta.items():
+                    item = items.get((user_id, ingredient_id))
+                    if item is None:
+                        if amount > 0:
+                            created.append(ShoppingListItem(
+                                user_id=user_id,
+                                ingredient_id=ingredient_id,
+                                amount=amount,
+                            ))
+                    elif item.amount + amount > 0:
+                        item.amount += amount
+                        updated.append(item)
+                    else:
+                        deleted.append(item.pk)
+            ShoppingListItem.objects.bulk_create(created)
+            ShoppingListItem.objects.bulk_update(updated, ('amount',))
+            ShoppingListItem.objects.filter(pk__in=deleted).delete()
+
+
+def add_recipe_amounts(user_id, recipe_id, sign=1):
+    """Добавляет ингредиенты рецепта в сводный список пользователя
+    (sign=-1 - убирает)."""
+    apply_shopping_delta(
+        (user_id,),
+        {
+            pk: sign * amount
+            for pk, amount in get_recipe_amounts(recipe_id).items()
+        },
+    )
+
+
+def add_recipes_amounts(user_id, recipe_ids):
+    """add_recipe_amounts для нескольких рецептов одним пересчётом."""
+    apply_shopping_delta(
+        (user_id,),
+        dict(
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('ingredient_id')
+            .annotate(total=Sum('amount'))
+            .order_by()
+        ),
+    )
+
+
+def get_tracked_recipes():
+    if not hasattr(_tracked, 'recipe_ids'):
+        _tracked.recipe_ids = set()
+    return _tracked.recipe_ids
+
+
+def add_ingredient_rows(rows, sign=1):
+    """Переносит вставленные (sign=-1 - удалённые) строки RecipeIngredient
+    (recipe_id, ingredient_id, amount) в сводные списки пользователей, у
+    которых рецепт в корзине. Рецепты внутри track_recipe_amounts
+    пропускаются: блок сам перенесёт итоговую разницу."""
+    tracked = get_tracked_recipes()
+    deltas = defaultdict(Counter)
+    for recipe_id, ingredient_id, amount in rows:
+        if recipe_id not in tracked:
+            deltas[recipe_id][ingredient_id] += sign * amount
+    for recipe_id, delta in deltas.items():
+        apply_shopping_delta(
+            ShoppingList.objects.filter(recipe_id=recipe_id).values_list(
+                'user_id', flat=True
+            ),
+            delta,
+        )
+
+
+@contextmanager
+def track_recipe_amounts(recipe):
+    """Переносит изменения ингредиентов recipe внутри блока в сводные
+    списки пользователей, у которых рецепт в корзине, одной разницей
+    вместо построчных обработчиков (bulk_create их и не вызывает)."""
+    before = get_recipe_amounts(recipe.id) if recipe.pk else Counter()
+    tracked = get_tracked_recipes()
+    tracked.add(recipe.id)
+    try:
+        yield
+    finally:
+        tracked.discard(recipe.id)
+    delta = get_recipe_amounts(recipe.id)
+    delta.subtract(before)
+    apply_shopping_delta(
+        ShoppingList.objects.filter(recipe_id=recipe.id).values_list(
+            'user_id', flat=True
+        ),
+        delta,
+    )
+
+
+def get_expected_items(user_ids):
+    """Сводные списки user_ids, посчитанные заново по корзинам."""
+    return {
+        (user_id, ingredient_id): total
+        for user_id, ingredient_id, total in RecipeIngredient.objects.filter(
+            recipe__in_shopping_list__user_id__in=user_ids
+        )
+        .values_list('recipe__in_shopping_list__user_id', 'ingredient_id')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    }
+
+
+def rebuild_shopping_items(user_ids, fix=True):
+    """Сверяет ShoppingListItem пользователей user_ids с пересчётом по
+    корзинам и, если fix, исправляет расхождения. Возвращает число
+    недостающих, лишних и неверных позиций."""
+    drift = Counter(missing=0, extra=0, wrong=0)
+    with transaction.atomic():
+        if fix:
+            lock_users(user_ids)
+        expected = get_expected_items(user_ids)
+        updated, deleted = [], []
+        for item in ShoppingListItem.objects.filter(user_id__in=user_ids):
+            amount = expected.pop((item.user_id, item.ingredient_id), None)
+            if amount is None:
+                drift['extra'] += 1
+                deleted.append(item.pk)
+            elif amount != item.amount:
+                drift['wrong'] += 1
+                item.amount = amount
+                updated.append(item)
+        drift['missing'] = len(expected)
+        if fix:
+            ShoppingListItem.objects.bulk_create(
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient_id, amount=amount
+                )
+                for (user_id, ingredient_id), amount in expected.items()
+            )
+            ShoppingListItem.objects.bulk_update(updated, ('amount',))
+            ShoppingListItem.objects.filter(pk__in=deleted).delete()
+    return drift
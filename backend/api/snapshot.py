@@ -0,0 +1,259 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+
+from api.cache import (
+    build_ingredients, build_tags, get_version, to_json_bytes,
+)
+
+MAGIC = b'FGCS'
+FORMAT_VERSION = 1
+SECTIONS = (
+    'ingredient_ids',
+    'ingredient_names',
+    'ingredient_units',
+    'tag_ids',
+    'tag_fields',
+    'string_offsets',
+    'strings',
+    'ingredients_body',
+    'tags_body',
+)
+HEADER = struct.Struct('<4sIqqIII' + 'QQ' * len(SECTIONS))
+TAG_FIELDS = ('name', 'color', 'slug')
+
+
+def _pad(data):
+    return data + b'\0' * (-len(data) % 8)
+
+
+class _StringTable:
+    def __init__(self):
+        self.index = {}
+        self.offsets = array('I', [0])
+        self.blob = bytearray()
+
+    def add(self, string):
+        if string not in self.index:
+            self.index[string] = len(self.index)
+            self.blob += string.encode('utf-8')
+            self.offsets.append(len(self.blob))
+        return self.index[string]
+
+
+def write_snapshot(path, ingredients, tags, versions):
+    """Записывает снимок справочника в path атомарно: через временный
+    файл и os.replace, чтобы читатели видели либо старую, либо новую
+    версию целиком."""
+    ingredients_body = to_json_bytes(ingredients)
+    tags_body = to_json_bytes(tags)
+    ingredients = sorted(ingredients, key=lambda item: item['id'])
+    tags = sorted(tags, key=lambda item: item['id'])
+    strings = _StringTable()
+    sections = {
+        'ingredient_ids': array('q', (item['id'] for item in ingredients)),
+        'ingredient_names': array(
+            'I', (strings.add(item['name']) for item in ingredients)
+        ),
+        'ingredient_units': array(
+            'I',
+            (strings.add(item['measurement_unit']) for item in ingredients),
+        ),
+        'tag_ids': array('q', (item['id'] for item in tags)),
+        'tag_fields': array(
+            'I',
+            (strings.add(tag[field]) for tag in tags for field in TAG_FIELDS),
+        ),
+    }
+    sections['string_offsets'] = strings.offsets
+    sections['strings'] = bytes(strings.blob)
+    sections['ingredients_body'] = ingredients_body
+    sections['tags_body'] = tags_body
+
+    payload, layout = bytearray(), []
+    offset = HEADER.size + (-HEADER.size % 8)
+    for name in SECTIONS:
+        data = sections[name]
+        data = data.tobytes() if isinstance(data, array) else data
+        layout.extend((offset + len(payload), len(data)))
+        payload += _pad(data)
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        versions['ingredients'],
+        versions['tags'],
+        len(ingredients),
+        len(tags),
+        len(strings.index),
+        *layout,
+    )
+
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as snapshot_file:
+        snapshot_file.write(_pad(header))
+        snapshot_file.write(payload)
+        snapshot_file.flush()
+        os.fsync(snapshot_file.fileno())
+    os.replace(tmp_path, path)
+
+
+def publish_snapshot(path=None):
+    """Строит снимок текущих версий тегов и ингредиентов из БД."""
+    path = path or settings.CATALOG_SNAPSHOT_PATH
+    versions = {
+        'ingredients': get_version('ingredients'),
+        'tags': get_version('tags'),
+    }
+    write_snapshot(path, build_ingredients(), build_tags(), versions)
+    return versions
+
+
+class MappedSection:
+    """Часть снимка (tags или ingredients) с интерфейсом CatalogSnapshot."""
+
+    def __init__(self, name, version, body, lookup):
+        self.name = name
+        self.version = version
+        self.etag = f'"{name}-{version}"'
+        self._body = body
+        self._lookup = lookup
+
+    @property
+    def list_body(self):
+        return self._body
+
+    def detail_body(self, pk):
+        item = self._lookup(pk)
+        return None if item is None else to_json_bytes(item)
+
+
+class MappedCatalog:
+    """Снимок справочника, отображённый в память только для чтения.
+
+    Все воркеры gunicorn отображают один и тот же файл, поэтому страницы
+    снимка в памяти общие. Идентификаторы хранятся отсортированными
+    массивами, строки - в таблице со смещениями.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as snapshot_file:
+            self.stat = os.fstat(snapshot_file.fileno())
+            self._mmap = mmap.mmap(
+                snapshot_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        view = memoryview(self._mmap)
+        (
+            magic,
+            format_version,
+            ingredients_version,
+            tags_version,
+            self.ingredients_count,
+            self.tags_count,
+            _,
+            *layout,
+        ) = HEADER.unpack_from(view)
+        if magic != MAGIC or format_version != FORMAT_VERSION:
+            raise ValueError(f'{path} is not a catalog snapshot')
+        self.versions = {
+            'ingredients': ingredients_version,
+            'tags': tags_version,
+        }
+        sections = {
+            name: view[layout[2 * pos]:layout[2 * pos] + layout[2 * pos + 1]]
+            for pos, name in enumerate(SECTIONS)
+        }
+        self._ingredient_ids = sections['ingredient_ids'].cast('q')
+        self._ingredient_names = sections['ingredient_names'].cast('I')
+        self._ingredient_units = sections['ingredient_units'].cast('I')
+        self._tag_ids = sections['tag_ids'].cast('q')
+        self._tag_fields = sections['tag_fields'].cast('I')
+        self._string_offsets = sections['string_offsets'].cast('I')
+        self._strings = sections['strings']
+        self._bodies = {
+            'ingredients': sections['ingredients_body'],
+            'tags': sections['tags_body'],
+        }
+
+    def string(self, index):
+        start = self._string_offsets[index]
+        end = self._string_offsets[index + 1]
+        return str(self._strings[start:end], 'utf-8')
+
+    @staticmethod
+    def _position(ids, pk):
+        pos = bisect_left(ids, pk)
+        return pos if pos < len(ids) and ids[pos] == pk else None
+
+    def ingredient(self, pk):
+        pos = self._position(self._ingredient_ids, pk)
+        if pos is None:
+            return None
+        return {
+            'id': pk,
+            'name': self.string(self._ingredient_names[pos]),
+            'measurement_unit': self.string(self._ingredient_units[pos]),
+        }
+
+    def tag(self, pk):
+        pos = self._position(self._tag_ids, pk)
+        if pos is None:
+            return None
+        fields = self._tag_fields[pos * 3:pos * 3 + 3]
+        tag = {'id': pk}
+        tag.update(
+            (field, self.string(index))
+            for field, index in zip(TAG_FIELDS, fields)
+        )
+        return tag
+
+    def section(self, name):
+        lookup = self.ingredient if name == 'ingredients' else self.tag
+        return MappedSection(
+            name, self.versions[name], self._bodies[name], lookup
+        )
+
+
+class SnapshotReader:
+    """Отслеживает файл снимка и подменяет отображение, когда файл
+    заменён новой публикацией. Файл проверяется не чаще раза в
+    CATALOG_SNAPSHOT_CHECK_INTERVAL секунд."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._catalog = None
+        self._checked = 0
+
+    def _is_current(self, path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return True
+        current = self._catalog.stat
+        return (stat.st_ino, stat.st_mtime_ns) == (
+            current.st_ino, current.st_mtime_ns
+        )
+
+    def get(self):
+        path = settings.CATALOG_SNAPSHOT_PATH
+        if not path:
+            return None
+        now = time.monotonic()
+        if now - self._checked < settings.CATALOG_SNAPSHOT_CHECK_INTERVAL:
+            return self._catalog
+        with self._lock:
+            self._checked = now
+            if self._catalog is None or not self._is_current(path):
+                try:
+                    self._catalog = MappedCatalog(path)
+                except (FileNotFoundError, ValueError):
+                    self._catalog = None
+        return self._catalog
+
+
+snapshot_reader = SnapshotReader()
@@ -1,3 +1,1396 @@
-from django.test import TestCase
+import io
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured, ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import (
+    SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+    skipUnlessDBFeature,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.http import http_date
+from reportlab.pdfbase import pdfmetrics
+from rest_framework.test import APIClient
+
+from api import cache as catalog_cache, jobs
+from api.cache import get_version
+from api.checks import check_report_backend
+from api.counters import get_recipe_counters
+from api.fragments import get_fragment_key, get_recipe_fragments
+from api.management.commands.export_shopping_lists import get_buy_lists
+from api.metrics import get_metrics
+from api.report import (
+    FONT_NAME, get_paragraph_style, get_report_backend, register_font,
+)
+from api.recipe_sets import (
+    get_recipe_ids, get_recipe_set_key, get_viewer_stamp,
+)
+from api.search import (
+    IngredientIndex, fuzzy_search_ingredients, get_trigrams,
+)
+from api.serializers import refresh_recipe_cards
+from api.shopping_cache import (
+    FileCache, get_shopping_list_report, shopping_list_cache,
+)
+from api.shopping_items import rebuild_shopping_items, track_recipe_amounts
+from api.snapshot import (
+    MappedCatalog, SnapshotReader, publish_snapshot, snapshot_reader,
+)
+from recipes.models import (
+    TAGS_MASK_BITS, Favorite, Ingredient, Recipe, RecipeCounterShard,
+    RecipeIngredient, RecipeTag, ShoppingList, ShoppingListItem,
+    ShoppingListJob, Tag, Unit,
+)
+from users.models import Follow, User
+
+
+class RecipeDetailQueriesTest(TestCase):
+    """Число запросов recipe_detail не зависит от связей рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        unit = Unit.objects.create(name='г')
+        recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=cls.author,
+        )
+        for number in range(3):
+            recipe.tags.add(
+                Tag.objects.create(
+                    name=f'Тег {number}',
+                    color='#000000',
+                    slug=f'tag{number}',
+                )
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit=unit
+                ),
+                amount=number + 1,
+            )
+        refresh_recipe_cards([recipe])
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        Follow.objects.create(user=cls.user, author=cls.author)
+        cls.recipe = recipe
+        cls.url = f'/api/recipes/{recipe.id}/'
+
+    def test_anonymous_detail(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['ingredients']), 3)
+        self.assertFalse(response.json()['is_favorited'])
+
+    def test_user_detail(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = client.get(self.url)
+        data = response.json()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(data['tags']), 3)
+        self.assertTrue(data['is_favorited'])
+        self.assertFalse(data['is_in_shopping_cart'])
+        self.assertTrue(data['author']['is_subscribed'])
+
+    def test_foreign_recipe_update(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.assertNumQueries(1):
+            response = client.patch(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class IngredientListTest(TestCase):
+    """Полный список ингредиентов: единицы измерения берутся тем же
+    запросом, число запросов не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        units = [Unit.objects.create(name=name) for name in ('г', 'мл', 'шт')]
+        Ingredient.objects.bulk_create(
+            Ingredient(
+                name=f'Ингредиент {number:02}',
+                measurement_unit=units[number % len(units)],
+            )
+            for number in range(30)
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def test_limit_offset(self):
+        url = '/api/ingredients/?limit=10&offset=5'
+        self.client.get(url)
+        with self.assertNumQueries(1):
+            response = self.client.get(url)
+        data = response.json()
+        self.assertEqual(data['count'], 30)
+        self.assertEqual(len(data['results']), 10)
+        self.assertEqual(
+            [
+                (item['name'], item['measurement_unit'])
+                for item in data['results'][:3]
+            ],
+            [
+                ('Ингредиент 05', 'шт'),
+                ('Ингредиент 06', 'г'),
+                ('Ингредиент 07', 'мл'),
+            ],
+        )
+
+    def test_count_follows_catalog_version(self):
+        url = '/api/ingredients/?limit=10'
+        self.assertEqual(self.client.get(url).json()['count'], 30)
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name='Новый', measurement_unit=Unit.objects.first()
+            )
+        self.assertEqual(self.client.get(url).json()['count'], 31)
+
+    def test_stream(self):
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/ingredients/?stream=1')
+            items = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(items), 30)
+        self.assertEqual(
+            {item['measurement_unit'] for item in items}, {'г', 'мл', 'шт'}
+        )
+
+
+class CatalogTest(TestCase):
+    """Справочники отдаются из снимка: без запросов к БД, пока версия
+    не сменилась, и с 304 по ETag."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+        Ingredient.objects.create(
+            name='Соль', measurement_unit=Unit.objects.create(name='г')
+        )
+
+    def setUp(self):
+        cache.clear()
+        catalog_cache._catalogs.clear()
+
+    def test_hits_without_queries(self):
+        for url in ('/api/tags/', f'/api/tags/{self.tag.id}/',
+                    '/api/ingredients/'):
+            with self.subTest(url=url):
+                etag = self.client.get(url)['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response['ETag'], etag)
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_new_version(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', color='#49B64E', slug='lunch')
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(
+            [tag['slug'] for tag in response.json()], ['breakfast', 'lunch']
+        )
+
+
+class CatalogSnapshotTest(TestCase):
+    """Снимок справочника в файле: публикация, чтение без БД и подмена
+    файла новой публикацией."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.unit = Unit.objects.create(name='г')
+        cls.salt = Ingredient.objects.create(
+            name='Соль', measurement_unit=cls.unit
+        )
+        cls.tag = Tag.objects.create(
+            name='Завтрак', color='#E26C2D', slug='breakfast'
+        )
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'catalog.snapshot')
+        settings_override = self.settings(
+            CATALOG_SNAPSHOT_PATH=self.path,
+            CATALOG_SNAPSHOT_CHECK_INTERVAL=0,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(setattr, snapshot_reader, '_catalog', None)
+
+    def test_publish(self):
+        versions = publish_snapshot()
+        catalog = MappedCatalog(self.path)
+        self.assertEqual(catalog.versions, versions)
+        self.assertEqual(
+            catalog.ingredient(self.salt.id),
+            {'id': self.salt.id, 'name': 'Соль', 'measurement_unit': 'г'},
+        )
+        self.assertEqual(catalog.tag(self.tag.id)['slug'], 'breakfast')
+        self.assertIsNone(catalog.ingredient(self.salt.id + 1))
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/ingredients/{self.salt.id}/')
+        self.assertEqual(response.json()['name'], 'Соль')
+
+    def test_stale_snapshot_is_not_served(self):
+        publish_snapshot()
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(
+                name='Сахар', measurement_unit=self.unit
+            )
+        response = self.client.get('/api/ingredients/')
+        self.assertIn('Сахар', [item['name'] for item in response.json()])
+
+    def test_atomic_swap(self):
+        publish_snapshot()
+        reader = SnapshotReader()
+        old = reader.get()
+        with self.captureOnCommitCallbacks(execute=True):
+            sugar = Ingredient.objects.create(
+                name='Сахар', measurement_unit=self.unit
+            )
+        publish_snapshot()
+        new = reader.get()
+        self.assertIsNot(new, old)
+        self.assertIsNone(old.ingredient(sugar.id))
+        self.assertEqual(old.ingredient(self.salt.id)['name'], 'Соль')
+        self.assertEqual(new.ingredient(sugar.id)['name'], 'Сахар')
+        self.assertEqual(
+            os.listdir(os.path.dirname(self.path)), ['catalog.snapshot']
+        )
+
+
+class RecipeListTest(TestCase):
+    """Список рецептов: фильтры и постраничная выдача."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        Recipe.objects.bulk_create(
+            Recipe(
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.gif',
+                author=cls.user,
+            )
+            for number in range(8)
+        )
+        unit = Unit.objects.create(name='г')
+        tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit=unit
+        )
+        for recipe in Recipe.objects.all():
+            recipe.tags.add(tag)
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=1
+            )
+        refresh_recipe_cards(Recipe.objects.all())
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertEmptyList(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 0)
+        self.assertEqual(response.json()['results'], [])
+
+    def test_anonymous_is_favorited(self):
+        for query in ('is_favorited=1', 'is_in_shopping_cart=1'):
+            with self.subTest(query=query):
+                self.assertEmptyList(
+                    APIClient().get(f'/api/recipes/?{query}')
+                )
+
+    def assertListQueries(self, client, cold, warm):
+        """Число запросов списка не зависит от размера страницы: ни с
+        пустым кэшем (COUNT, страница, фрагменты карточек и, для
+        пользователя, его множества id и подписки), ни с заполненным."""
+        for limit in (2, 6):
+            with self.subTest(limit=limit):
+                cache.clear()
+                with self.assertNumQueries(cold):
+                    response = client.get(f'/api/recipes/?limit={limit}')
+                self.assertEqual(len(response.json()['results']), limit)
+                with self.assertNumQueries(warm):
+                    client.get(f'/api/recipes/?limit={limit}')
+
+    def test_anonymous_list_queries(self):
+        self.assertListQueries(APIClient(), cold=3, warm=1)
+
+    def test_user_list_queries(self):
+        self.assertListQueries(self.client, cold=6, warm=2)
+
+    def test_stale_cached_count(self):
+        # COUNT (8) кэшируется первым запросом; новый рецепт всё равно
+        # попадает в выдачу, а не обрезается устаревшим числом.
+        self.assertEqual(
+            self.client.get('/api/recipes/?limit=4').json()['count'], 8
+        )
+        Recipe.objects.create(
+            name='Новый рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=self.user,
+        )
+        response = self.client.get('/api/recipes/?limit=4&page=3')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+        self.assertEqual(response.json()['count'], 9)
+        self.assertIsNone(response.json()['next'])
+        # На средних страницах число может отставать до истечения кэша,
+        # строки - нет.
+        response = self.client.get('/api/recipes/?limit=4&page=2')
+        self.assertEqual(len(response.json()['results']), 4)
+        self.assertIsNotNone(response.json()['next'])
+
+    def test_empty_recipe_sets(self):
+        for name in ('is_favorited', 'is_in_shopping_cart'):
+            with self.subTest(name=name):
+                self.assertEmptyList(
+                    self.client.get(f'/api/recipes/?{name}=1')
+                )
+                response = self.client.get(f'/api/recipes/?{name}=0')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['count'], 8)
+
+    def test_tags_filter(self):
+        other = Tag.objects.create(
+            name='Другой', color='#ffffff', slug='other'
+        )
+        Tag.objects.create(name='Пустой', color='#ff0000', slug='empty')
+        recipes = list(Recipe.objects.order_by('id')[:3])
+        with self.captureOnCommitCallbacks(execute=True):
+            for recipe in recipes:
+                recipe.tags.add(other)
+        for query, expected in (
+            ('tags=other', recipes),
+            ('tags=empty', []),
+            ('tags=other&tags=empty', recipes),
+            ('tags=tag&tags=other', Recipe.objects.all()),
+        ):
+            with self.subTest(query=query):
+                response = self.client.get(f'/api/recipes/?{query}&limit=10')
+                self.assertEqual(
+                    sorted(
+                        result['id'] for result in response.json()['results']
+                    ),
+                    sorted(recipe.id for recipe in expected),
+                )
+
+
+class ConditionalGetTest(TestCase):
+    """304 по If-None-Match и If-Modified-Since: ответ отдаётся без
+    сериализации рецептов и учитывается в счётчиках."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=cls.user,
+        )
+        refresh_recipe_cards(Recipe.objects.all())
+
+    def setUp(self):
+        cache.clear()
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def set_modified(self, timestamp):
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            modified=datetime.fromtimestamp(timestamp, tz=timezone.utc)
+        )
+
+    def assertNotModified(self, url, **headers):
+        before = get_metrics()
+        response = self.client.get(url, **headers)
+        self.assertEqual(response.status_code, 304)
+        after = get_metrics()
+        self.assertEqual(
+            after['recipes.not_modified'], before['recipes.not_modified'] + 1
+        )
+        self.assertEqual(
+            after['recipes.conditional'], before['recipes.conditional'] + 1
+        )
+        for name in ('recipe_fragments.hits', 'recipe_fragments.misses'):
+            self.assertEqual(after[name], before[name])
+        return response
+
+    def test_list_if_none_match(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotModified(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.set_modified(time.time() - 60)
+        response = self.client.get(
+            '/api/recipes/', HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(get_metrics()['recipes.conditional'], 2)
+
+    def test_detail_if_none_match(self):
+        response = self.client.get(self.url)
+        self.assertNotModified(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_detail_if_modified_since(self):
+        self.set_modified(time.time() - 3600)
+        response = self.client.get(self.url)
+        last_modified = response['Last-Modified']
+        self.assertNotModified(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+
+        self.set_modified(time.time() - 60)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=last_modified
+        )
+        self.assertEqual(response.status_code, 200)
+
+    def test_same_second_change(self):
+        # Пока секунда изменения не прошла, Last-Modified не отдаётся, и
+        # второе изменение в ту же секунду не даёт 304.
+        second = int(time.time()) + 60
+        self.set_modified(second + 0.1)
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        self.set_modified(second + 0.5)
+        response = self.client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=http_date(second + 1)
+        )
+        self.assertEqual(response.status_code, 200)
+
+
+class ReportBackendTest(SimpleTestCase):
+
+    @override_settings(SHOPPING_LIST_REPORT_BACKEND='pdf')
+    def test_unknown_backend(self):
+        with self.assertRaises(ImproperlyConfigured):
+            get_report_backend()
+        self.assertEqual(
+            [error.id for error in check_report_backend(None)], ['api.E001']
+        )
+
+    def test_known_backends(self):
+        self.assertEqual(get_report_backend().name, 'canvas')
+        self.assertEqual(get_report_backend('text').extension, 'txt')
+        self.assertEqual(check_report_backend(None), [])
+
+    def test_font_set_up_once(self):
+        # Шрифт и стиль создаются один раз на процесс, в том числе при
+        # одновременной первой отрисовке в нескольких потоках.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            names = set(executor.map(lambda _: register_font(), range(8)))
+        self.assertEqual(names, {FONT_NAME})
+        font = pdfmetrics.getFont(FONT_NAME)
+        style = get_paragraph_style()
+        for name in ('canvas', 'platypus'):
+            get_report_backend(name).write(
+                ['Соль (г) - 5'], 'Список', io.BytesIO()
+            )
+        self.assertIs(pdfmetrics.getFont(FONT_NAME), font)
+        self.assertIs(get_paragraph_style(), style)
+        self.assertEqual(style.fontName, FONT_NAME)
+
+    def test_canvas_pages(self):
+        # Строки читаются из генератора и рисуются по мере поступления;
+        # общее число страниц - одна форма на весь документ, без копий
+        # состояния каждой страницы.
+        output = io.BytesIO()
+        get_report_backend('canvas').write(
+            (f'Ингредиент {number} (г) - {number}' for number in range(3000)),
+            'Список',
+            output,
+        )
+        pdf = output.getvalue()
+        pages = len(re.findall(rb'/Type /Page\b', pdf))
+        self.assertGreater(pages, 10)
+        self.assertEqual(pdf.count(b'/Subtype /Form'), 1)
+        self.assertGreaterEqual(pdf.count(b'/FormXob.page_count'), pages)
+
+
+class CatalogVersionTest(SimpleTestCase):
+    """Версия, сдвинутая другим процессом (воркер, import_csv), видна
+    этому: кэш по умолчанию общий для процессов."""
+
+    def test_bump_from_another_process(self):
+        version = get_version('tags')
+        subprocess.run(
+            (
+                sys.executable, 'manage.py', 'shell', '-c',
+                "from api.cache import bump_version; bump_version('tags')",
+            ),
+            cwd=settings.BASE_DIR,
+            check=True,
+        )
+        self.assertGreater(get_version('tags'), version)
+
+
+class IngredientFuzzySearchTest(SimpleTestCase):
+    """Нечёткий поиск в памяти: похожесть как у similarity() из pg_trgm,
+    в том числе когда обход прерван по бюджету времени."""
+
+    names = (
+        'морковь', 'морковь по-корейски', 'молоко', 'мука', 'лук',
+    ) + tuple(f'соль {number}' for number in range(2000))
+
+    def setUp(self):
+        self.index = IngredientIndex.from_rows(
+            (pk, name, 'г') for pk, name in enumerate(sorted(self.names))
+        )
+
+    @staticmethod
+    def similarity(first, second):
+        first, second = get_trigrams(first), get_trigrams(second)
+        return len(first & second) / len(first | second)
+
+    def names_found(self, string, **kwargs):
+        return [
+            row['name']
+            for row in self.index.fuzzy_search(string, threshold=0.3, **kwargs)
+        ]
+
+    def test_matches_trigram_similarity(self):
+        expected = sorted(
+            (name for name in self.names
+             if self.similarity('морков', name) >= 0.3),
+            key=lambda name: (-self.similarity('морков', name), name),
+        )
+        self.assertEqual(self.names_found('морков', budget=1000), expected)
+
+    def test_budget_cut_off_keeps_full_counts(self):
+        # При нулевом бюджете обход прерывается на первой порции редкой
+        # триграммы, но похожесть найденных кандидатов считается по всем.
+        found = self.names_found('соль морковь', budget=0)
+        full = self.names_found('соль морковь', budget=1000)
+        self.assertIn('морковь', found)
+        self.assertEqual(found, [name for name in full if name in found])
+
+
+class IngredientFuzzySearchQueryTest(TransactionTestCase):
+
+    @skipUnless(connection.vendor == 'postgresql', 'нужен pg_trgm')
+    def test_threshold_does_not_leak_to_connection(self):
+        unit = Unit.objects.create(name='г')
+        Ingredient.objects.create(name='морковь', measurement_unit=unit)
+        with connection.cursor() as cursor:
+            cursor.execute('SHOW pg_trgm.similarity_threshold')
+            before = cursor.fetchone()[0]
+            with self.settings(FUZZY_SEARCH_THRESHOLD=0.1):
+                rows = fuzzy_search_ingredients('морков')
+            cursor.execute('SHOW pg_trgm.similarity_threshold')
+            self.assertEqual(cursor.fetchone()[0], before)
+        self.assertEqual([row['name'] for row in rows], ['морковь'])
+
+
+class StaleCacheTest(TestCase):
+    """Запрос, прочитавший данные до коммита изменения и положивший их в
+    кэш после него, не отдаёт устаревшее следующим запросам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=cls.user,
+        )
+        refresh_recipe_cards([cls.recipe])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_recipe_set(self):
+        stamp = get_viewer_stamp(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+        cache.set(
+            get_recipe_set_key('favorites', self.user.id, stamp), frozenset()
+        )
+        self.assertEqual(
+            get_recipe_ids(self.user, 'favorites'), {self.recipe.id}
+        )
+
+    def test_recipe_fragment(self):
+        page = Recipe.objects.only('id', 'modified').get(pk=self.recipe.pk)
+        stale = get_recipe_fragments([page])[self.recipe.id]
+        cache.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Новое название'
+            self.recipe.save()
+            refresh_recipe_cards([self.recipe])
+        cache.set(
+            get_fragment_key(page, get_version('recipe_fragments')), stale
+        )
+        page = Recipe.objects.only('id', 'modified').get(pk=self.recipe.pk)
+        self.assertEqual(
+            get_recipe_fragments([page])[self.recipe.id]['name'],
+            'Новое название',
+        )
+
+
+class RecipeCardSyncTest(TestCase):
+    """Recipe.card и Recipe.tags_mask следуют за связями рецепта, как бы
+    они ни менялись."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        cls.tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', color='#000000', slug=f'tag{number}'
+            )
+            for number in range(2)
+        ]
+        cls.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit=Unit.objects.create(name='г')
+        )
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=self.user,
+        )
+
+    def assertCard(self, tags, ingredients):
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.tags_mask, Tag.get_mask(tags))
+        self.assertEqual(
+            sorted(tag['id'] for tag in self.recipe.card['tags']),
+            sorted(tag.id for tag in tags),
+        )
+        self.assertEqual(len(self.recipe.card['ingredients']), ingredients)
+
+    def test_orm_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeTag.objects.create(recipe=self.recipe, tag=self.tags[0])
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=self.ingredient, amount=1
+            )
+        self.assertCard(self.tags[:1], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.add(self.tags[1])
+        self.assertCard(self.tags, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.remove(self.tags[0])
+        self.assertCard(self.tags[1:], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tags[0].recipes.add(self.recipe)
+        self.assertCard(self.tags, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.tags.clear()
+        self.assertCard([], 1)
+
+    def test_tag_bits_exhausted(self):
+        Tag.objects.bulk_create(
+            Tag(name=f'Бит {bit}', color='#000000', slug=f'bit{bit}', bit=bit)
+            for bit in range(TAGS_MASK_BITS)
+            if bit not in {tag.bit for tag in self.tags}
+        )
+        tag = Tag(name='Лишний', color='#000000', slug='extra')
+        with self.assertRaises(ValidationError):
+            tag.full_clean()
+        with self.assertRaises(ValidationError):
+            tag.save()
+
+
+class ShoppingListItemSyncTest(TestCase):
+    """Сводный список следует за ингредиентами рецептов в корзине, как
+    бы они ни менялись."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        unit = Unit.objects.create(name='г')
+        cls.ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {number}', measurement_unit=unit
+            )
+            for number in range(4)
+        ]
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=self.user,
+        )
+        for ingredient in self.ingredients[:2]:
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=ingredient, amount=1
+            )
+        ShoppingList.objects.create(user=self.user, recipe=self.recipe)
+
+    def assertItems(self, *amounts):
+        self.assertEqual(
+            list(self.user.shopping_list_items.order_by(
+                'ingredient_id'
+            ).values_list('amount', flat=True)),
+            list(amounts),
+        )
+        self.assertEqual(
+            rebuild_shopping_items([self.user.id], fix=False),
+            {'missing': 0, 'extra': 0, 'wrong': 0},
+        )
+
+    def test_orm_writes(self):
+        self.assertItems(1, 1)
+        row = RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.ingredients[2], amount=5
+        )
+        self.assertItems(1, 1, 5)
+        row.amount = 3
+        row.save()
+        self.assertItems(1, 1, 3)
+        row.delete()
+        self.assertItems(1, 1)
+        self.recipe.ingredients.add(
+            self.ingredients[3], through_defaults={'amount': 2}
+        )
+        self.assertItems(1, 1, 2)
+        other = Recipe.objects.create(
+            name='Другой рецепт',
+            text='Описание',
+            cooking_time=5,
+            image='recipes/images/recipe.gif',
+            author=self.user,
+        )
+        ShoppingList.objects.create(user=self.user, recipe=other)
+        RecipeIngredient.objects.create(
+            recipe=other, ingredient=self.ingredients[0], amount=7
+        )
+        self.assertItems(8, 1, 2)
+        self.recipe.delete()
+        self.assertItems(7)
+
+    def test_tracked_block(self):
+        with track_recipe_amounts(self.recipe):
+            self.recipe.ingredients.clear()
+            RecipeIngredient.objects.create(
+                recipe=self.recipe, ingredient=self.ingredients[0], amount=4
+            )
+        self.assertItems(4)
+
+
+class RecipeToggleTest(TransactionTestCase):
+    """Избранное и корзина: число запросов и одновременные клики по
+    одной паре (пользователь, рецепт)."""
+
+    THREADS = 8
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        unit = Unit.objects.create(name='г')
+        self.recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=self.user,
+        )
+        for number in range(2):
+            RecipeIngredient.objects.create(
+                recipe=self.recipe,
+                ingredient=Ingredient.objects.create(
+                    name=f'Ингредиент {number}', measurement_unit=unit
+                ),
+                amount=number + 1,
+            )
+
+    def get_url(self, action):
+        return f'/api/recipes/{self.recipe.id}/{action}/'
+
+    def hammer(self, method, *urls, data=None):
+        """Одновременные запросы из THREADS потоков по очереди к urls."""
+        barrier = threading.Barrier(self.THREADS)
+
+        def click(number):
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                return getattr(client, method)(
+                    urls[number % len(urls)], data, format='json'
+                ).status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as pool:
+            return sorted(pool.map(click, range(self.THREADS)))
+
+    def assertNumStatements(self, number, request, *args):
+        """Как assertNumQueries, но без BEGIN, который пишет в журнал
+        только бэкенд SQLite."""
+        with CaptureQueriesContext(connection) as context:
+            response = request(*args)
+        statements = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'] != 'BEGIN'
+        ]
+        self.assertEqual(len(statements), number, statements)
+        return response
+
+    @override_settings(RECIPE_COUNTER_SHARDS=1)
+    def test_favorite_queries(self):
+        # Блокировка пользователя, запись, счётчик: шард уже есть, поэтому
+        # это один UPDATE без вставки шарда.
+        RecipeCounterShard.objects.create(recipe=self.recipe, shard=0)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = self.get_url('favorite')
+        response = self.assertNumStatements(4, client.post, url)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            set(response.json()), {'id', 'name', 'image', 'cooking_time'}
+        )
+        self.assertEqual(
+            get_recipe_counters(self.recipe)['favorites_count'], 1
+        )
+        response = self.assertNumStatements(4, client.delete, url)
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            get_recipe_counters(self.recipe)['favorites_count'], 0
+        )
+        self.assertEqual(client.delete(url).status_code, 400)
+        missing = '/api/recipes/0/favorite/'
+        self.assertEqual(client.post(missing).status_code, 404)
+        self.assertEqual(client.delete(missing).status_code, 404)
+
+    @override_settings(RECIPE_COUNTER_SHARDS=1)
+    def test_shopping_cart_queries(self):
+        # Блокировка, рецепт, запись, ингредиенты рецепта, блокировка и
+        # позиции сводного списка, их запись, счётчик.
+        RecipeCounterShard.objects.create(recipe=self.recipe, shard=0)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = self.get_url('shopping_cart')
+        response = self.assertNumStatements(8, client.post, url)
+        self.assertEqual(response.status_code, 201)
+        response = self.assertNumStatements(8, client.delete, url)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    # Потокам нужна БД с блокировками строк: общая SQLite в памяти
+    # отвечает на одновременную запись "database table is locked".
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_favorite(self):
+        url = self.get_url('favorite')
+        self.assertEqual(
+            self.hammer('post', url), [201] + [400] * (self.THREADS - 1)
+        )
+        self.assertEqual(Favorite.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(
+            get_recipe_counters(self.recipe)['favorites_count'], 1
+        )
+        self.assertEqual(
+            self.hammer('delete', url), [204] + [400] * (self.THREADS - 1)
+        )
+        self.assertFalse(Favorite.objects.filter(user=self.user).exists())
+        self.assertEqual(
+            get_recipe_counters(self.recipe)['favorites_count'], 0
+        )
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_shopping_cart(self):
+        url = self.get_url('shopping_cart')
+        self.assertEqual(
+            self.hammer('post', url), [201] + [400] * (self.THREADS - 1)
+        )
+        self.assertEqual(
+            ShoppingList.objects.filter(user=self.user).count(), 1
+        )
+        self.assertEqual(
+            sorted(self.user.shopping_list_items.values_list(
+                'amount', flat=True
+            )),
+            [1, 2],
+        )
+        self.assertEqual(
+            self.hammer('delete', url), [204] + [400] * (self.THREADS - 1)
+        )
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    @skipUnlessDBFeature('has_select_for_update')
+    def test_concurrent_single_and_batch_cart(self):
+        urls = (self.get_url('shopping_cart'), '/api/recipes/shopping_cart/')
+        self.hammer('post', *urls, data={'recipes': [self.recipe.id]})
+        self.assertEqual(
+            sorted(self.user.shopping_list_items.values_list(
+                'amount', flat=True
+            )),
+            [1, 2],
+        )
+        self.assertEqual(get_recipe_counters(self.recipe)['cart_count'], 1)
+        self.hammer('delete', *urls, data={'recipes': [self.recipe.id]})
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assertEqual(get_recipe_counters(self.recipe)['cart_count'], 0)
+
+    def test_batch_shopping_cart(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        other = Recipe.objects.create(
+            name='Другой рецепт',
+            text='Описание',
+            cooking_time=5,
+            image='recipes/images/recipe.gif',
+            author=self.user,
+        )
+        RecipeIngredient.objects.create(
+            recipe=other,
+            ingredient=Ingredient.objects.first(),
+            amount=10,
+        )
+        ShoppingList.objects.create(user=self.user, recipe=self.recipe)
+        recipes = [self.recipe.id, other.id, 0]
+        response = client.post(
+            '/api/recipes/shopping_cart/', {'recipes': recipes}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['already_added', 'added', 'not_found'],
+        )
+        self.assertEqual(
+            sorted(self.user.shopping_list_items.values_list(
+                'amount', flat=True
+            )),
+            [2, 11],
+        )
+        response = client.delete(
+            '/api/recipes/shopping_cart/', {'recipes': recipes}, format='json'
+        )
+        self.assertEqual(
+            [result['status'] for result in response.json()['results']],
+            ['removed', 'removed', 'not_found'],
+        )
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+
+class FileCacheTest(SimpleTestCase):
+    """Файловый кэш отчётов: попадание, атомарная запись и вытеснение
+    давно не читавшихся файлов."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.cache = FileCache(directory.name, max_size=25)
+
+    def put(self, name, data, age=None):
+        self.cache.put(name, lambda output: output.write(data)).close()
+        if age is not None:
+            stamp = time.time() - age
+            os.utime(self.cache.path(name), (stamp, stamp))
+
+    def read(self, name):
+        cached = self.cache.open(name)
+        if cached is None:
+            return None
+        with cached:
+            return cached.read()
+
+    def test_hit(self):
+        self.assertIsNone(self.read('a'))
+        self.put('a', b'0123456789')
+        self.assertEqual(self.read('a'), b'0123456789')
+
+    def test_evict_least_recently_read(self):
+        self.put('a', b'a' * 10, age=100)
+        self.put('b', b'b' * 10, age=50)
+        self.read('a')
+        self.put('c', b'c' * 10)
+        self.assertEqual(sorted(os.listdir(self.cache.directory)), ['a', 'c'])
+
+    def test_keep_new_file_over_limit(self):
+        self.put('a', b'a' * 10, age=100)
+        self.put('big', b'x' * 30)
+        self.assertEqual(os.listdir(self.cache.directory), ['big'])
+
+    def test_failed_write(self):
+        def write(output):
+            output.write(b'partial')
+            raise ValueError
+
+        with self.assertRaises(ValueError):
+            self.cache.put('a', write)
+        self.assertEqual(os.listdir(self.cache.directory), [])
+
+
+@override_settings(SHOPPING_LIST_REPORT_BACKEND='text')
+class ShoppingListReportCacheTest(TestCase):
+    """Отчёт берётся из кэша по хэшу корзины и строится заново, когда
+    корзина меняется."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        cls.recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {number}',
+                text='Описание',
+                cooking_time=10,
+                image='recipes/images/recipe.gif',
+                author=cls.user,
+            )
+            for number in range(2)
+        ]
+        ShoppingList.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        cache.clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(
+            setattr, shopping_list_cache, 'directory',
+            shopping_list_cache.directory,
+        )
+        shopping_list_cache.directory = directory.name
+
+    def get_report_name(self):
+        with get_shopping_list_report(self.user) as report_file:
+            return os.path.basename(report_file.name)
+
+    def test_hit_and_new_cart(self):
+        name = self.get_report_name()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.get_report_name(), name)
+        self.assertEqual(get_metrics()['shopping_lists.hits'], 1)
+        ShoppingList.objects.create(user=self.user, recipe=self.recipes[1])
+        self.assertNotEqual(self.get_report_name(), name)
+        self.assertEqual(get_metrics()['shopping_lists.misses'], 2)
+
+
+class ShoppingListFormatTest(TestCase):
+    """Формат выгрузки списка покупок выбирается по ?format= или Accept;
+    без них отдаётся PDF."""
+
+    url = '/api/recipes/download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        recipe = Recipe.objects.create(
+            name='Рецепт',
+            text='Описание',
+            cooking_time=10,
+            image='recipes/images/recipe.gif',
+            author=cls.user,
+        )
+        RecipeIngredient.objects.create(
+            recipe=recipe,
+            ingredient=Ingredient.objects.create(
+                name='Соль', measurement_unit=Unit.objects.create(name='г')
+            ),
+            amount=5,
+        )
+        ShoppingList.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(
+            setattr, shopping_list_cache, 'directory',
+            shopping_list_cache.directory,
+        )
+        shopping_list_cache.directory = directory.name
+
+    def download(self, query='', **headers):
+        response = self.client.get(self.url + query, **headers)
+        content = b''.join(
+            response.streaming_content
+            if response.streaming else (response.content,)
+        )
+        return response, content
+
+    def test_default_pdf(self):
+        response, content = self.download()
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_negotiation(self):
+        for query, headers, media_type in (
+            ('?format=txt', {}, 'text/plain'),
+            ('?format=csv', {}, 'text/csv'),
+            ('?format=json', {}, 'application/json'),
+            ('', {'HTTP_ACCEPT': 'text/csv'}, 'text/csv'),
+            ('', {'HTTP_ACCEPT': 'text/plain'}, 'text/plain'),
+            (
+                '?format=txt',
+                {'HTTP_ACCEPT': 'text/html,application/xml;q=0.9,*/*;q=0.8'},
+                'text/plain',
+            ),
+        ):
+            with self.subTest(query=query, headers=headers):
+                response, content = self.download(query, **headers)
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(
+                    response['Content-Type'], f'{media_type}; charset=utf-8'
+                )
+                self.assertIn('Соль', content.decode('utf-8'))
+
+    def test_formats(self):
+        _, content = self.download('?format=csv')
+        self.assertEqual(
+            content.decode('utf-8').splitlines(),
+            ['name,measurement_unit,amount', 'Соль,г,5'],
+        )
+        _, content = self.download('?format=json')
+        self.assertEqual(
+            json.loads(content),
+            [{'name': 'Соль', 'measurement_unit': 'г', 'amount': 5}],
+        )
+
+    def test_unknown_format(self):
+        self.assertEqual(
+            self.client.get(self.url + '?format=xml').status_code, 404
+        )
+        self.assertEqual(
+            self.client.get(self.url, HTTP_ACCEPT='image/png').status_code,
+            406,
+        )
+
+
+class ExportShoppingListsTest(TestCase):
+    """Выгрузка списков покупок всех пользователей: один проход по
+    ShoppingListItem и по файлу на пользователя."""
+
+    @classmethod
+    def setUpTestData(cls):
+        unit = Unit.objects.create(name='г')
+        salt, sugar = (
+            Ingredient.objects.create(name=name, measurement_unit=unit)
+            for name in ('Соль', 'Сахар')
+        )
+        cls.users = [
+            User.objects.create(
+                username=f'user{number}',
+                email=f'user{number}@example.com',
+                is_active=number != 2,
+            )
+            for number in range(3)
+        ]
+        for user, ingredient, amount in (
+            (cls.users[0], salt, 5),
+            (cls.users[0], sugar, 10),
+            (cls.users[1], sugar, 1),
+            (cls.users[2], salt, 2),
+        ):
+            ShoppingListItem.objects.create(
+                user=user, ingredient=ingredient, amount=amount
+            )
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def test_get_buy_lists(self):
+        with self.assertNumQueries(1):
+            buy_lists = list(get_buy_lists(active=True))
+        self.assertEqual(
+            [(username, len(items)) for _, username, items in buy_lists],
+            [('user0', 2), ('user1', 1)],
+        )
+        self.assertEqual(
+            buy_lists[0][2][0],
+            {
+                'ingredient__name': 'Сахар',
+                'ingredient__measurement_unit__name': 'г',
+                'amount': 10,
+            },
+        )
+        self.assertEqual(len(list(get_buy_lists(active=False))), 3)
+
+    def test_command(self):
+        call_command(
+            'export_shopping_lists', self.directory, format='csv', workers=1,
+            stdout=io.StringIO(),
+        )
+        first, second = self.users[:2]
+        self.assertEqual(
+            sorted(os.listdir(self.directory)),
+            [f'{first.id}_user0.csv', f'{second.id}_user1.csv'],
+        )
+        path = os.path.join(self.directory, f'{first.id}_user0.csv')
+        with open(path, encoding='utf-8') as exported:
+            self.assertEqual(
+                exported.read().splitlines(),
+                ['name,measurement_unit,amount', 'Сахар,г,10', 'Соль,г,5'],
+            )
+
+
+class RecordingExecutor:
+    """Пул, который только запоминает поставленные задания."""
+
+    def __init__(self):
+        self.job_ids = []
+
+    def submit(self, function, job_id):
+        self.job_ids.append(job_id)
+
+
+@override_settings(SHOPPING_LIST_REPORT_BACKEND='text')
+class ShoppingListJobTest(TransactionTestCase):
+    """Задания на отчёт: постановка, захват, возврат зависших и
+    вытесненных из кэша. run_job закрывает соединение, поэтому тест
+    без общей транзакции."""
+
+    def setUp(self):
+        self.user = User.objects.create(
+            username='user', email='user@example.com'
+        )
+        self.executor = RecordingExecutor()
+        previous = jobs._executor
+        jobs._executor = self.executor
+        self.addCleanup(setattr, jobs, '_executor', previous)
+        self.addCleanup(jobs._submitted.clear)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(
+            setattr, shopping_list_cache, 'directory',
+            shopping_list_cache.directory,
+        )
+        shopping_list_cache.directory = directory.name
+
+    def get_job(self, job):
+        return ShoppingListJob.objects.get(pk=job.pk)
+
+    def test_enqueue_once_per_process(self):
+        job = jobs.enqueue_shopping_list(self.user)
+        self.assertEqual(jobs.enqueue_shopping_list(self.user), job)
+        for _ in range(3):
+            jobs.recover(self.get_job(job))
+        self.assertEqual(self.executor.job_ids, [job.id])
+        self.assertEqual(job.status, ShoppingListJob.PENDING)
+
+    def test_resubmit_after_grace_period(self):
+        job = jobs.enqueue_shopping_list(self.user)
+        with self.settings(REPORT_JOB_RESUBMIT_AFTER=0):
+            jobs.recover(self.get_job(job))
+        self.assertEqual(self.executor.job_ids, [job.id, job.id])
+
+    def test_queue_limit(self):
+        with self.settings(REPORT_JOB_QUEUE_LIMIT=1):
+            jobs.enqueue_shopping_list(self.user)
+            other = User.objects.create(
+                username='other', email='other@example.com'
+            )
+            with self.assertRaises(jobs.QueueFull):
+                jobs.enqueue_shopping_list(other)
+
+    def test_claim_once(self):
+        job = jobs.enqueue_shopping_list(self.user)
+        jobs.run_job(job.id)
+        job = self.get_job(job)
+        self.assertEqual(job.status, ShoppingListJob.DONE)
+        self.assertTrue(job.file_name)
+        finished = job.finished
+        jobs.run_job(job.id)
+        self.assertEqual(self.get_job(job).finished, finished)
+        with jobs.open_job_result(job) as report_file:
+            self.assertIn(b'user', report_file.read())
+
+    def test_timeout_recovery(self):
+        job = jobs.enqueue_shopping_list(self.user)
+        jobs.run_job(job.id)
+        ShoppingListJob.objects.filter(pk=job.pk).update(
+            status=ShoppingListJob.RUNNING,
+            started=timezone.now() - timedelta(
+                seconds=settings.REPORT_JOB_TIMEOUT - 10
+            ),
+        )
+        self.assertEqual(
+            jobs.recover(self.get_job(job)).status, ShoppingListJob.RUNNING
+        )
+        ShoppingListJob.objects.filter(pk=job.pk).update(
+            started=timezone.now() - timedelta(
+                seconds=settings.REPORT_JOB_TIMEOUT + 10
+            ),
+        )
+        self.assertEqual(
+            jobs.recover(self.get_job(job)).status, ShoppingListJob.PENDING
+        )
+        self.assertEqual(self.executor.job_ids, [job.id, job.id])
+        self.assertEqual(self.get_job(job).status, ShoppingListJob.PENDING)
+
+    def test_result_evicted(self):
+        job = jobs.enqueue_shopping_list(self.user)
+        jobs.run_job(job.id)
+        job = self.get_job(job)
+        shopping_list_cache.delete(job.file_name)
+        self.assertIsNone(jobs.open_job_result(job))
+        self.assertEqual(self.get_job(job).status, ShoppingListJob.PENDING)
+        self.assertEqual(self.executor.job_ids, [job.id, job.id])
+        jobs.run_job(job.id)
+        self.assertEqual(self.get_job(job).status, ShoppingListJob.DONE)
+
+    def test_done_without_file_name(self):
+        job = ShoppingListJob.objects.create(
+            user=self.user, status=ShoppingListJob.DONE
+        )
+        self.assertIsNone(jobs.open_job_result(job))
+        self.assertEqual(self.get_job(job).status, ShoppingListJob.PENDING)
+        self.assertEqual(self.executor.job_ids, [job.id])
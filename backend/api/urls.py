@@ -4,8 +4,12 @@ from rest_framework import routers
 from api.views import (
     download_shopping_cart,
     favorite,
+    favorite_batch,
     ingredients,
+    metrics,
     shopping_cart,
+    shopping_cart_batch,
+    shopping_cart_job,
     tags, recipe_list, recipe_detail,
 )
 from users.views import CustomUserViewSet, subscribe, subscriptions
@@ -20,18 +24,30 @@ urlpatterns = [
     path('ingredients/', ingredients, name='ingredients'),
     path('ingredients/<int:pk>/', ingredients, name='ingredients_detail'),
     path('recipes/<int:pk>/favorite/', favorite, name='favorite'),
+    path('recipes/favorite/', favorite_batch, name='favorite_batch'),
     path(
         'recipes/<int:pk>/shopping_cart/', shopping_cart, name='shopping_cart'
     ),
+    path(
+        'recipes/shopping_cart/',
+        shopping_cart_batch,
+        name='shopping_cart_batch',
+    ),
     path(
         'recipes/download_shopping_cart/',
         download_shopping_cart,
         name='download_shopping_cart',
     ),
+    path(
+        'recipes/download_shopping_cart/jobs/<int:pk>/',
+        shopping_cart_job,
+        name='shopping_cart_job',
+    ),
     path('recipes/', recipe_list, name='recipes'),
     path('recipes/<int:pk>/', recipe_detail, name='recipes_detail'),
     path('users/<int:pk>/subscribe/', subscribe, name='users_subscribe'),
     path('users/subscriptions/', subscriptions, name='users_subscriptions'),
+    path('metrics/', metrics, name='metrics'),
     path('', include(router_v1.urls)),
     path('auth/', include('djoser.urls.authtoken')),
 ]
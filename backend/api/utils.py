@@ -1,14 +1,22 @@
-import io
+import json
 from typing import Dict
 
-from reportlab.lib.pagesizes import A4
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen import canvas
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (
+    Exists, OuterRef, Prefetch, prefetch_related_objects,
+)
 from rest_framework import exceptions, status
+from rest_framework.generics import get_object_or_404
 from rest_framework.response import Response
 
-from recipes.models import RecipeIngredient
+from api.counters import add_to_counter
+from api.recipe_sets import RECIPE_SET_MODELS, get_recipe_ids, touch_viewer
+from api.shopping_items import add_recipes_amounts, lock_users
+from recipes.models import Favorite, Recipe, RecipeIngredient, ShoppingList
+from users.models import Follow
+
+RECIPE_SHORT_FIELDS = ('id', 'name', 'image', 'cooking_time')
 
 
 def get_end_letter(value):
@@ -28,52 +36,219 @@ def get_recipe_serializer():
     return RecipeFavoriteSerializer
 
 
-def create_or_delete_record(request, record, serializer_data, params):
-    if request.method == 'POST':
+def toggle_recipe_record(request, model, pk):
+    """Добавляет (POST) или удаляет (DELETE) запись model (избранное,
+    корзина) пользователя о рецепте pk.
 
-        if record.exists():
+    Повторная вставка отсекается уникальным ограничением, а не проверкой
+    exists(), поэтому из одновременных запросов запись создаёт ровно один,
+    остальные получают 400. Рецепт читается только для ответа на POST и
+    только нужными ответу полями. Запросы одного пользователя, как и в
+    toggle_recipe_records, выполняются по очереди: обработчики вставки и
+    удаления срабатывают один раз на запись.
+    """
+    if request.method == 'POST':
+        try:
+            with transaction.atomic():
+                lock_users((request.user.id,))
+                recipe = get_object_or_404(
+                    Recipe.objects.only(*RECIPE_SHORT_FIELDS), pk=pk
+                )
+                model.objects.create(user=request.user, recipe=recipe)
+        except IntegrityError:
             raise exceptions.ValidationError('records already exists.')
+        return Response(
+            get_recipe_serializer()(recipe).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    with transaction.atomic():
+        lock_users((request.user.id,))
+        deleted, _ = model.objects.filter(
+            user=request.user, recipe_id=pk
+        ).delete()
+    if not deleted:
+        get_object_or_404(Recipe.objects.only('id'), pk=pk)
+        raise exceptions.ValidationError('records does not exists.')
+    return Response(status=status.HTTP_204_NO_CONTENT)
 
-        record.create(user=request.user, **params)
-        return Response(serializer_data, status=status.HTTP_201_CREATED)
 
-    if request.method == 'DELETE':
-        if not record.exists():
-            raise exceptions.ValidationError('records does not exists.')
-        record.delete()
-        return Response(status=status.HTTP_204_NO_CONTENT)
+def get_batch_recipe_ids(data):
+    recipe_ids = data.get('recipes') if isinstance(data, dict) else None
+    if not isinstance(recipe_ids, list) or not recipe_ids:
+        raise exceptions.ValidationError('recipes required')
+    if len(recipe_ids) > settings.RECIPE_BATCH_MAX:
+        raise exceptions.ValidationError(
+            f'no more than {settings.RECIPE_BATCH_MAX} recipes at once'
+        )
+    if not all(
+        isinstance(pk, int) and not isinstance(pk, bool) for pk in recipe_ids
+    ):
+        raise exceptions.ValidationError('recipes must be a list of ids')
+    return list(dict.fromkeys(recipe_ids))
 
-    return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
+def toggle_recipe_records(request, name):
+    """Пакетная toggle_recipe_record: добавляет (POST) или удаляет
+    (DELETE) рецепты из списка recipes в избранное ('favorites') или
+    корзину ('shopping_cart') и возвращает результат по каждому id.
 
-def get_shopping_list_text(
-        ingredient__name, ingredient__measurement_unit__name, amount
-):
+    Существование рецептов проверяется одним запросом, вставка - одним
+    bulk_create, удаление - одним delete. Запросы одного пользователя,
+    пакетные и одиночные (toggle_recipe_record), выполняются по очереди
+    под блокировкой его строки: поэтому changed совпадает с записями,
+    которые действительно вставлены или удалены, и счётчики со сводным
+    списком не сдвигаются дважды.
+    """
+    recipe_ids = get_batch_recipe_ids(request.data)
+    model = RECIPE_SET_MODELS[name]
+    user = request.user
+    with transaction.atomic():
+        lock_users((user.id,))
+        recipes = {
+            recipe.id: recipe
+            for recipe in Recipe.objects.filter(pk__in=recipe_ids).only(
+                *RECIPE_SHORT_FIELDS
+            )
+        }
+        added = set(
+            model.objects.filter(user=user, recipe_id__in=recipes).values_list(
+                'recipe_id', flat=True
+            )
+        )
+        if request.method == 'POST':
+            changed = recipes.keys() - added
+            model.objects.bulk_create(
+                (model(user=user, recipe_id=pk) for pk in changed),
+                ignore_conflicts=True,
+            )
+            # bulk_create не шлёт сигналы: то же, что recipes.signals
+            if changed:
+                touch_viewer(user.id)
+                if model is ShoppingList:
+                    add_recipes_amounts(user.id, changed)
+            for pk in changed:
+                add_to_counter(model, pk, 1)
+            statuses = ('added', 'already_added')
+        else:
+            changed = added
+            if changed:
+                model.objects.filter(
+                    user=user, recipe_id__in=changed
+                ).delete()
+            statuses = ('removed', 'not_added')
+    serializer = get_recipe_serializer()
+    results = []
+    for pk in recipe_ids:
+        if pk not in recipes:
+            results.append({'id': pk, 'status': 'not_found'})
+            continue
+        result = {
+            'id': pk,
+            'status': statuses[0] if pk in changed else statuses[1],
+        }
+        if request.method == 'POST':
+            result['recipe'] = serializer(recipes[pk]).data
+        results.append(result)
+    return Response({'results': results})
+
+
+def stream_json_array(items):
+    """Построчная отдача JSON-массива для StreamingHttpResponse."""
+    separator = '['
+    for item in items:
+        yield separator + json.dumps(
+            item, ensure_ascii=False, separators=(',', ':')
+        )
+        separator = ','
+    yield '[]' if separator == '[' else ']'
+
+
+def get_recipe_prefetches():
     return (
-        f'{ingredient__name}'
-        f' ({ingredient__measurement_unit__name}) - {amount}'
+        'tags',
+        Prefetch(
+            'recipe_ingredient',
+            queryset=RecipeIngredient.objects.select_related(
+                'ingredient__measurement_unit'
+            ),
+        ),
+    )
+
+
+def with_recipe_relations(queryset):
+    """Автор, теги и ингредиенты с единицами измерения загружаются
+    фиксированным числом запросов на страницу рецептов."""
+    return queryset.select_related('author').prefetch_related(
+        *get_recipe_prefetches()
     )
 
 
-def create_pdf_from_queryset(queryset, username):
-    pdfmetrics.registerFont(TTFont('DejaVuSerif', 'DejaVuSerif.ttf', 'UTF-8'))
-    pdf_file = io.BytesIO()
-    w, h = A4
-    p = canvas.Canvas(pdf_file, pagesize=A4)
-    text = p.beginText(50, h - 50)
-    text.setFont('DejaVuSerif', 20)
-    text.textLine(f'Список покупок для {username}')
-    text.textLine(' ')
-    text.textLine(' ')
-    text.setFont('DejaVuSerif', 12)
-
-    for items in queryset:
-        text.textLine(get_shopping_list_text(**items))
-    p.drawText(text)
-    p.showPage()
-    p.save()
-    pdf_file.seek(0)
-    return pdf_file
+def prefetch_recipe_relations(recipes):
+    """То же для уже загруженных рецептов, у которых нет карточки
+    (Recipe.card): остальным связанные объекты не нужны."""
+    recipes = [recipe for recipe in recipes if not recipe.card]
+    if recipes:
+        prefetch_related_objects(
+            recipes, 'author', *get_recipe_prefetches()
+        )
+
+
+def get_recipes_context(request, recipes):
+    """Контекст RecipeSerializer для страницы рецептов: множества id
+    рецептов в избранном и корзине пользователя (из кэша api.recipe_sets)
+    и авторов, на которых он подписан."""
+
+    context = {'request': request}
+    user = request.user
+    if user.is_anonymous:
+        return context
+
+    author_ids = {recipe.author_id for recipe in recipes}
+    context['favorites'] = get_recipe_ids(user, 'favorites')
+    context['shopping_cart'] = get_recipe_ids(user, 'shopping_cart')
+    context['following'] = set(
+        user.follower.filter(author_id__in=author_ids).values_list(
+            'author_id', flat=True
+        )
+    )
+    return context
+
+
+def get_recipe_detail(request, pk):
+    """Рецепт и контекст RecipeSerializer для recipe_detail одним
+    запросом: карточка (Recipe.card) и флаги пользователя (избранное,
+    корзина, подписка на автора) подзапросами EXISTS."""
+    queryset = Recipe.objects.only(
+        'id', 'author_id', 'pub_date', 'modified', 'card'
+    )
+    user = request.user
+    context = {'request': request}
+    if user.is_anonymous:
+        return get_object_or_404(queryset, pk=pk), context
+
+    recipe = get_object_or_404(
+        queryset.annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingList.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef('author'))
+            ),
+        ),
+        pk=pk,
+    )
+    context['favorites'] = {recipe.id} if recipe.is_favorited else set()
+    context['shopping_cart'] = (
+        {recipe.id} if recipe.is_in_shopping_cart else set()
+    )
+    context['following'] = (
+        {recipe.author_id} if recipe.is_subscribed else set()
+    )
+    return recipe, context
 
 
 def create_recipe_ingredients(ingredients, recipe):
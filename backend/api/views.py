@@ -1,110 +1,191 @@
-from django.db.models import Case, F, FloatField, Q, Sum, Value, When
-from django.http import FileResponse
+import os
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.urls import reverse
 from django_filters.utils import translate_validation
 from rest_framework import status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import (
+    api_view, permission_classes, renderer_classes,
+)
 from rest_framework.generics import get_object_or_404
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import (
+    AllowAny, IsAdminUser, IsAuthenticated,
+)
 from rest_framework.response import Response
 
+from api.cache import catalog_response
+from api.conditional import (
+    get_last_modified, get_not_modified_response, get_recipes_etag,
+    set_validators,
+)
 from api.filters import RecipeFilter
+from api.fragments import get_recipe_fragments
+from api.jobs import (
+    QueueFull, enqueue_shopping_list, get_job_metrics, open_job_result,
+    recover,
+)
+from api.metrics import get_metrics
 from api.permissions import IsOwnerOrStaffOrReadOnly, check_object_permissions
-from api.report import create_pdf_from_queryset
-from api.serializers import (
-    IngredientSerializer, RecipeFavoriteSerializer, RecipeSerializer,
-    TagSerializer,
+from api.renderers import SHOPPING_LIST_RENDERERS
+from api.search import fuzzy_search_ingredients, ingredient_index
+from api.serializers import IngredientSerializer, RecipeSerializer
+from api.shopping_cache import (
+    get_buy_list_queryset, get_shopping_list_report,
+)
+from api.utils import (
+    get_recipe_detail, get_recipes_context, stream_json_array,
+    toggle_recipe_record, toggle_recipe_records,
+)
+from recipes.models import (
+    Favorite, Ingredient, Recipe, ShoppingList, ShoppingListJob,
 )
-from api.utils import create_or_delete_record
-from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
-from users.pagination import CustomPageNumberPagination
+from users.pagination import (
+    CachedCountPageNumberPagination, IngredientLimitOffsetPagination,
+    RecipeCursorPagination,
+)
+
+INGREDIENTS_CHUNK_SIZE = 2000
 
 
 @api_view(('GET',))
 @permission_classes((AllowAny,))
 def tags(request, pk=None):
-    queryset = (
-        Tag.objects.all() if pk is None else get_object_or_404(Tag, pk=pk)
-    )
-    serializer = TagSerializer(queryset, many=pk is None)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    return catalog_response(request, 'tags', pk)
 
 
 @api_view(('GET',))
 @permission_classes((AllowAny,))
 def ingredients(request, pk=None):
     if pk is not None:
-        serializer = IngredientSerializer(
-            get_object_or_404(Ingredient, pk=pk), many=False
-        )
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return catalog_response(request, 'ingredients', pk)
 
     string = request.query_params.get('name', None)
+    if string is not None and request.query_params.get('fuzzy') == '1':
+        return Response(
+            fuzzy_search_ingredients(string), status=status.HTTP_200_OK
+        )
     if string is not None:
-        queryset = (
-            Ingredient.objects.select_related('measurement_unit')
-            .filter(Q(name__istartswith=string) | Q(name__icontains=string))
-            .annotate(
-                k1=Case(
-                    When(name__istartswith=string, then=Value(1.0)),
-                    default=Value(0.0),
-                    output_field=FloatField(),
-                ),
-                k2=Case(
-                    When(name__icontains=string, then=Value(1.0)),
-                    default=Value(0.0),
-                    output_field=FloatField(),
-                ),
-                rank=F("k1") + F("k2"),
-            )
-            .distinct()
-            .order_by('-rank', 'name')
+        return Response(
+            ingredient_index.search(string), status=status.HTTP_200_OK
         )
-    else:
-        queryset = Ingredient.objects.all()
 
-    serializer = IngredientSerializer(queryset, many=True)
-    return Response(serializer.data, status=status.HTTP_200_OK)
+    queryset = Ingredient.objects.select_related('measurement_unit')
+    if request.query_params.get('stream') == '1':
+        rows = queryset.values_list(
+            'id', 'name', 'measurement_unit__name'
+        ).iterator(chunk_size=INGREDIENTS_CHUNK_SIZE)
+        return StreamingHttpResponse(
+            stream_json_array(
+                {'id': pk, 'name': name, 'measurement_unit': unit}
+                for pk, name, unit in rows
+            ),
+            content_type='application/json',
+        )
+
+    paginator = IngredientLimitOffsetPagination()
+    page = paginator.paginate_queryset(queryset, request)
+    if page is not None:
+        serializer = IngredientSerializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    return catalog_response(request, 'ingredients')
 
 
 @api_view(('POST', 'DELETE'))
 @permission_classes((IsAuthenticated,))
 def favorite(request, pk=None):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    in_favorite = recipe.in_favorite.filter(user=request.user)
-    return create_or_delete_record(
-        request=request,
-        record=in_favorite,
-        serializer_data=RecipeFavoriteSerializer(recipe).data,
-        params={'recipe': recipe},
-    )
+    return toggle_recipe_record(request, Favorite, pk)
+
+
+@api_view(('POST', 'DELETE'))
+@permission_classes((IsAuthenticated,))
+def favorite_batch(request):
+    return toggle_recipe_records(request, 'favorites')
 
 
 @api_view(('POST', 'DELETE'))
 @permission_classes((IsAuthenticated,))
 def shopping_cart(request, pk=None):
-    recipe = get_object_or_404(Recipe, pk=pk)
-    in_shopping_list = recipe.in_shopping_list.filter(user=request.user)
-    return create_or_delete_record(
-        request=request,
-        record=in_shopping_list,
-        serializer_data=RecipeFavoriteSerializer(recipe).data,
-        params={'recipe': recipe},
-    )
+    # Удаление вычитает рецепт из ShoppingListItem - только один раз.
+    return toggle_recipe_record(request, ShoppingList, pk)
+
+
+@api_view(('POST', 'DELETE'))
+@permission_classes((IsAuthenticated,))
+def shopping_cart_batch(request):
+    return toggle_recipe_records(request, 'shopping_cart')
 
 
 @api_view(('GET',))
+@renderer_classes(SHOPPING_LIST_RENDERERS)
 @permission_classes((IsAuthenticated,))
 def download_shopping_cart(request):
-    user = request.user
-    recipes = user.shopping_list.values('recipe__id')
-    buy_list = (
-        RecipeIngredient.objects.filter(recipe__in=recipes)
-        .values('ingredient__name', 'ingredient__measurement_unit__name')
-        .annotate(amount=Sum('amount'))
-        .order_by('ingredient__name')
+    renderer = request.accepted_renderer
+    if renderer.format != 'pdf':
+        response = StreamingHttpResponse(
+            renderer.stream(
+                get_buy_list_queryset(request.user).iterator(),
+                request.user.username,
+            ),
+            content_type=f'{renderer.media_type}; charset=utf-8',
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="buy_list.{renderer.format}"'
+        )
+        return response
+    if request.query_params.get('async') == '1':
+        return enqueue_shopping_cart(request)
+    return get_report_response(get_shopping_list_report(request.user))
+
+
+def get_report_response(report_file):
+    extension = os.path.splitext(report_file.name)[1]
+    return FileResponse(
+        report_file, as_attachment=True, filename=f'buy_list{extension}'
+    )
+
+
+def get_job_data(request, job):
+    return {
+        'id': job.id,
+        'status': job.status,
+        'error': job.error,
+        'url': request.build_absolute_uri(
+            reverse('shopping_cart_job', args=(job.id,))
+        ),
+    }
+
+
+def enqueue_shopping_cart(request):
+    try:
+        job = enqueue_shopping_list(request.user)
+    except QueueFull:
+        return Response(
+            'Too many shopping lists in the queue, try again later.',
+            status=status.HTTP_503_SERVICE_UNAVAILABLE,
+            headers={'Retry-After': '10'},
+        )
+    return Response(
+        get_job_data(request, job), status=status.HTTP_202_ACCEPTED
+    )
+
+
+@api_view(('GET',))
+@permission_classes((IsAuthenticated,))
+def shopping_cart_job(request, pk=None):
+    job = recover(get_object_or_404(request.user.shopping_list_jobs, pk=pk))
+    if job.status == ShoppingListJob.DONE:
+        report_file = open_job_result(job)
+        if report_file is not None:
+            return get_report_response(report_file)
+    return Response(
+        get_job_data(request, job),
+        status=(
+            status.HTTP_200_OK
+            if job.status == ShoppingListJob.FAILED
+            else status.HTTP_202_ACCEPTED
+        ),
     )
-    pdf_file = create_pdf_from_queryset(buy_list, user.username)
-    return FileResponse(pdf_file, as_attachment=True, filename='buy_list.pdf')
 
 
 @api_view(('GET', 'POST'))
@@ -117,12 +198,28 @@ def recipe_list(request):
         if not filterset.is_valid():
             raise translate_validation(filterset.errors)
 
-        paginator = CustomPageNumberPagination()
-        queryset = paginator.paginate_queryset(filterset.qs, request)
-        serializer = RecipeSerializer(
-            queryset, many=True, context={'request': request}
+        paginator = (
+            RecipeCursorPagination()
+            if 'cursor' in request.query_params
+            else CachedCountPageNumberPagination()
+        )
+        queryset = paginator.paginate_queryset(
+            filterset.qs.only('id', 'author_id', 'pub_date', 'modified'),
+            request,
+        )
+        context = get_recipes_context(request, queryset)
+        envelope = paginator.get_paginated_response([]).data
+        envelope.pop('results')
+        etag = get_recipes_etag(queryset, context, envelope)
+        not_modified = get_not_modified_response(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        context['fragments'] = get_recipe_fragments(queryset)
+        serializer = RecipeSerializer(queryset, many=True, context=context)
+        return set_validators(
+            paginator.get_paginated_response(serializer.data), etag
         )
-        return paginator.get_paginated_response(serializer.data)
 
     if request.method == 'POST':
         return recipe_create(request)
@@ -152,9 +249,21 @@ def recipe_update(request, recipe):
 @permission_classes((IsOwnerOrStaffOrReadOnly,))
 def recipe_detail(request, pk=None):
     if request.method == 'GET':
-        queryset = get_object_or_404(Recipe, pk=pk)
-        serializer = RecipeSerializer(queryset, context={'request': request})
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        recipe, context = get_recipe_detail(request, pk)
+        etag = get_recipes_etag((recipe,), context)
+        last_modified = get_last_modified(request, recipe)
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        if not recipe.card:
+            context['fragments'] = get_recipe_fragments((recipe,))
+        serializer = RecipeSerializer(recipe, context=context)
+        return set_validators(
+            Response(serializer.data, status=status.HTTP_200_OK),
+            etag,
+            last_modified,
+        )
     obj = get_object_or_404(Recipe, pk=pk)
     if not check_object_permissions(request, obj):
         return Response(
@@ -170,3 +279,11 @@ def recipe_detail(request, pk=None):
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+
+@api_view(('GET',))
+@permission_classes((IsAdminUser,))
+def metrics(request):
+    data = get_metrics()
+    data.update(get_job_metrics(data))
+    return Response(data, status=status.HTTP_200_OK)
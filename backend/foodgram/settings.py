@@ -20,6 +20,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework.authtoken',
     'rest_framework',
     'djoser',
@@ -72,6 +73,27 @@ DATABASES = {
     }
 }
 
+# Версии справочников, отметки пользователей, множества id и счётчики
+# хранятся в кэше и должны быть общими для всех процессов (воркеры
+# gunicorn, import_csv, админка): иначе сдвиг версии в одном процессе не
+# виден остальным. По умолчанию - файловый кэш, общий для процессов
+# одного хоста; для нескольких хостов нужен Redis или Memcached.
+# LocMemCache свой у каждого процесса и не подходит.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache',
+        ),
+        'LOCATION': os.getenv(
+            'CACHE_LOCATION', default=os.path.join(BASE_DIR, 'cache', 'django')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+        },
+    }
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -106,6 +128,33 @@ NAME_FIELD_MAX_LENGTH = 200
 USER_NAME_MAX_LENGTH = 150
 SLUG_FIELD_MAX_LENGTH = 50
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+FUZZY_SEARCH_NORMALIZE = True
+FUZZY_SEARCH_THRESHOLD = 0.3
+FUZZY_SEARCH_LIMIT = 20
+FUZZY_SEARCH_BUDGET_MS = 50
+CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', default='')
+CATALOG_SNAPSHOT_CHECK_INTERVAL = 1
+PAGINATION_COUNT_CACHE_TIMEOUT = 10
+PAGINATION_ESTIMATE_THRESHOLD = 100000
+RECIPE_FRAGMENT_TIMEOUT = 60 * 60
+RECIPE_SET_TIMEOUT = 60 * 60
+RECIPE_SET_ID_LIST_MAX = 500
+RECIPE_BATCH_MAX = 100
+RECIPE_COUNTER_SHARDS = 16
+PDF_FONT_PATH = os.path.join(BASE_DIR, 'DejaVuSerif.ttf')
+# canvas, platypus или text (api.report.REPORT_BACKENDS)
+SHOPPING_LIST_REPORT_BACKEND = os.getenv(
+    'SHOPPING_LIST_REPORT_BACKEND', default='canvas'
+)
+SHOPPING_LIST_CACHE_DIR = os.getenv(
+    'SHOPPING_LIST_CACHE_DIR',
+    default=os.path.join(BASE_DIR, 'cache', 'shopping_lists'),
+)
+SHOPPING_LIST_CACHE_MAX_SIZE = 256 * 1024 * 1024
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_QUEUE_LIMIT = 100
+REPORT_JOB_TIMEOUT = 5 * 60
+REPORT_JOB_RESUBMIT_AFTER = 30
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
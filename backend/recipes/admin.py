@@ -1,8 +1,14 @@
 from django.contrib import admin
 
+from api.counters import get_recipe_counters
+from api.serializers import refresh_recipe_cards
+from api.shopping_items import track_recipe_amounts
 from api.utils import get_end_letter
 
-from .models import Favorite, Ingredient, Recipe, ShoppingList, Tag, Unit
+from .models import (
+    Favorite, Ingredient, Recipe, ShoppingList, ShoppingListItem,
+    ShoppingListJob, Tag, Unit,
+)
 
 
 @admin.register(Ingredient)
@@ -40,15 +46,20 @@ class RecipeTagsInLine(admin.TabularInline):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count', 'cart_count')
     list_display_links = ('name',)
     list_filter = ('name', 'author__username', 'tags')
     search_fields = ('name',)
     inlines = (RecipeIngredientsInLine, RecipeTagsInLine)
     readonly_fields = ('in_favorite',)
 
+    def save_related(self, request, form, formsets, change):
+        with track_recipe_amounts(form.instance):
+            super().save_related(request, form, formsets, change)
+        refresh_recipe_cards([form.instance])
+
     def in_favorite(self, obj):
-        label = obj.in_favorite.count()
+        label = get_recipe_counters(obj)['favorites_count']
         end_letter = get_end_letter(label)
         return f'всего рецепт добавлен в избранное  {label} раз{end_letter}'
 
@@ -65,3 +76,17 @@ class ShoppingListAdmin(admin.ModelAdmin):
     list_display = ('user', 'recipe')
     list_display_links = ('user',)
     list_filter = ('user__username',)
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount')
+    list_display_links = ('user',)
+    list_filter = ('user__username',)
+
+
+@admin.register(ShoppingListJob)
+class ShoppingListJobAdmin(admin.ModelAdmin):
+    list_display = ('user', 'status', 'created', 'started', 'finished')
+    list_display_links = ('user',)
+    list_filter = ('status',)
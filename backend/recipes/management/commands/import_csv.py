@@ -3,6 +3,7 @@ import sys
 
 from django.core.management.base import BaseCommand
 
+from api.cache import bump_version
 from recipes.models import Ingredient, Unit
 
 
@@ -30,6 +31,7 @@ class Command(BaseCommand):
             Ingredient.objects.bulk_create(
                 [Ingredient(**parameters) for parameters in params_for_create]
             )
+            bump_version('ingredients')
         except Exception as error:
             self.stdout.write(
                 self.style.ERROR(f'Error loading model {error}'),
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.3 on 2026-10-17 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0003_recipe_pub_date_id_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='card',
+            field=models.JSONField(blank=True, default=dict, editable=False, help_text='Теги, автор и ингредиенты рецепта в готовом для API виде', verbose_name='Карточка рецепта'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+from django.db import migrations, models
+
+BATCH_SIZE = 2000
+
+
+def fill_tag_bits(apps, schema_editor):
+    Tag = apps.get_model('recipes', 'Tag')
+    tags = list(Tag.objects.order_by('id'))
+    for bit, tag in enumerate(tags):
+        tag.bit = bit
+    Tag.objects.bulk_update(tags, ('bit',))
+
+
+def fill_tags_masks(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    RecipeTag = apps.get_model('recipes', 'RecipeTag')
+    masks = {}
+    rows = RecipeTag.objects.order_by('recipe_id').values_list(
+        'recipe_id', 'tag__bit'
+    )
+    for recipe_id, bit in rows.iterator():
+        if recipe_id not in masks and len(masks) >= BATCH_SIZE:
+            save_masks(Recipe, masks)
+            masks = {}
+        masks[recipe_id] = masks.get(recipe_id, 0) | 1 << bit
+    save_masks(Recipe, masks)
+
+
+def save_masks(Recipe, masks):
+    Recipe.objects.bulk_update(
+        [Recipe(id=pk, tags_mask=mask) for pk, mask in masks.items()],
+        ('tags_mask',),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_recipe_card'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='tags_mask',
+            field=models.BigIntegerField(default=0, editable=False, help_text='Биты Tag.bit всех тегов рецепта', verbose_name='Маска тегов'),
+        ),
+        migrations.RunPython(fill_tag_bits, migrations.RunPython.noop),
+        migrations.RunPython(fill_tags_masks, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='tag',
+            name='bit',
+            field=models.PositiveSmallIntegerField(editable=False, help_text='Номер бита тега в Recipe.tags_mask', unique=True, verbose_name='Бит тега'),
+        ),
+    ]
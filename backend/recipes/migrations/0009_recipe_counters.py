@@ -0,0 +1,59 @@
+# Generated by Django 3.2.3 on 2026-10-17 03:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    for field, model_name in (
+        ('favorites_count', 'Favorite'),
+        ('cart_count', 'ShoppingList'),
+    ):
+        counts = apps.get_model('recipes', model_name).objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(total=Count('id')).values(
+            'total'
+        )
+        Recipe.objects.update(**{field: Coalesce(Subquery(counts), 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Без ещё не свёрнутых RecipeCounterShard', verbose_name='В корзинах'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Без ещё не свёрнутых RecipeCounterShard', verbose_name='В избранном'),
+        ),
+        migrations.CreateModel(
+            name='RecipeCounterShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField(verbose_name='Шард')),
+                ('favorites_count', models.IntegerField(default=0, verbose_name='Изменение числа в избранном')),
+                ('cart_count', models.IntegerField(default=0, verbose_name='Изменение числа в корзинах')),
+                ('recipe', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='counter_shards', to='recipes.recipe', verbose_name='Рецепт')),
+            ],
+            options={
+                'verbose_name': 'шард счётчиков рецепта',
+                'verbose_name_plural': 'Шарды счётчиков рецептов',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='recipecountershard',
+            constraint=models.UniqueConstraint(fields=('recipe', 'shard'), name='unique_recipe_counter_shard'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# Номера установленных битов маски тегов: GIN-индекс по этому выражению
+# обслуживает фильтр ленты по тегам (оператор && в api.filters).
+CREATE_FUNCTION = '''
+CREATE OR REPLACE FUNCTION recipes_tag_bits(mask bigint)
+RETURNS integer[]
+LANGUAGE sql IMMUTABLE PARALLEL SAFE
+AS $$
+    SELECT coalesce(array_agg(bit), '{}')
+    FROM generate_series(0, 62) AS bit
+    WHERE mask & (1::bigint << bit) <> 0
+$$
+'''
+CREATE_INDEX = '''
+CREATE INDEX IF NOT EXISTS recipes_recipe_tag_bits_gin
+ON recipes_recipe USING gin (recipes_tag_bits(tags_mask))
+'''
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(CREATE_FUNCTION)
+    schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipes_recipe_tag_bits_gin')
+    schema_editor.execute('DROP FUNCTION IF EXISTS recipes_tag_bits(bigint)')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -1,10 +1,12 @@
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator
 from django.db import models
-from rest_framework.exceptions import ValidationError
 
 from users.models import User
 
+TAGS_MASK_BITS = 63
+
 
 class Tag(models.Model):
     """Foodgram tag model"""
@@ -27,6 +29,12 @@ class Tag(models.Model):
         verbose_name='Идентификатор тега',
         help_text='Идентификатор тега',
     )
+    bit = models.PositiveSmallIntegerField(
+        unique=True,
+        editable=False,
+        verbose_name='Бит тега',
+        help_text='Номер бита тега в Recipe.tags_mask',
+    )
 
     class Meta:
         verbose_name = 'тег'
@@ -35,6 +43,36 @@ class Tag(models.Model):
     def __str__(self):
         return self.name
 
+    @staticmethod
+    def get_free_bit():
+        """Первый не занятый тегами бит Recipe.tags_mask."""
+        used = set(Tag.objects.values_list('bit', flat=True))
+        bit = next(
+            (bit for bit in range(TAGS_MASK_BITS) if bit not in used), None
+        )
+        if bit is None:
+            raise ValidationError(
+                f'Тегов не может быть больше {TAGS_MASK_BITS}'
+            )
+        return bit
+
+    def clean(self):
+        if self.bit is None:
+            self.get_free_bit()
+
+    def save(self, *args, **kwargs):
+        if self.bit is None:
+            self.bit = self.get_free_bit()
+        super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_mask(tags):
+        """Битовая маска набора тегов, см. Recipe.tags_mask."""
+        mask = 0
+        for tag in tags:
+            mask |= 1 << tag.bit
+        return mask
+
 
 class Unit(models.Model):
     """Unit model for ingredients"""
@@ -122,6 +160,10 @@ class Recipe(models.Model):
         verbose_name='Дата публикации рецепта',
         auto_now_add=True,
     )
+    modified = models.DateTimeField(
+        verbose_name='Дата изменения рецепта',
+        auto_now=True,
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -135,6 +177,31 @@ class Recipe(models.Model):
         verbose_name='Теги рецепта',
         help_text='Теги рецепта',
     )
+    card = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Карточка рецепта',
+        help_text='Теги, автор и ингредиенты рецепта в готовом для API виде',
+    )
+    tags_mask = models.BigIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Маска тегов',
+        help_text='Биты Tag.bit всех тегов рецепта',
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+        help_text='Без ещё не свёрнутых RecipeCounterShard',
+    )
+    cart_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах',
+        help_text='Без ещё не свёрнутых RecipeCounterShard',
+    )
 
     class Meta:
         ordering = ('-pub_date',)
@@ -145,6 +212,11 @@ class Recipe(models.Model):
                 fields=('author', 'name'), name='unique__author_name'
             ),
         )
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'), name='recipe_pub_date_id_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
@@ -260,3 +332,120 @@ class ShoppingList(models.Model):
 
     def __str__(self):
         return f'{self.recipe} in {self.user} shopping list'
+
+
+class RecipeCounterShard(models.Model):
+    """Recipe favorites/cart counter deltas not folded into Recipe yet"""
+
+    # Без ограничения внешнего ключа: при каскадном удалении рецепта
+    # обработчики удаления избранного ещё пишут сюда, а осиротевшие
+    # строки убирает fold_recipe_counters.
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='counter_shards',
+        verbose_name='Рецепт',
+    )
+    shard = models.PositiveSmallIntegerField(verbose_name='Шард')
+    favorites_count = models.IntegerField(
+        default=0, verbose_name='Изменение числа в избранном'
+    )
+    cart_count = models.IntegerField(
+        default=0, verbose_name='Изменение числа в корзинах'
+    )
+
+    class Meta:
+        verbose_name = 'шард счётчиков рецепта'
+        verbose_name_plural = 'Шарды счётчиков рецептов'
+
+        constraints = (
+            models.UniqueConstraint(
+                fields=('recipe', 'shard'), name='unique_recipe_counter_shard'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.recipe_id} counters shard {self.shard}'
+
+
+class ShoppingListItem(models.Model):
+    """Users shopping list totals by ingredient"""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient, on_delete=models.CASCADE, verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        verbose_name = 'позиция списка покупок'
+        verbose_name_plural = 'Позиции списков покупок'
+
+        constraints = (
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_shopping_list_item',
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient} x {self.amount} in {self.user} list'
+
+
+class ShoppingListJob(models.Model):
+    """Shopping list PDF render job"""
+
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Готово'),
+        (FAILED, 'Ошибка'),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_jobs',
+        verbose_name='Пользователь',
+    )
+    status = models.CharField(
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+        db_index=True,
+        verbose_name='Состояние',
+    )
+    file_name = models.CharField(
+        max_length=100,
+        blank=True,
+        verbose_name='Файл',
+        help_text='Имя PDF в кэше списков покупок',
+    )
+    error = models.TextField(blank=True, verbose_name='Ошибка')
+    created = models.DateTimeField(
+        auto_now_add=True, verbose_name='Дата создания'
+    )
+    started = models.DateTimeField(
+        null=True, blank=True, verbose_name='Начало отрисовки'
+    )
+    finished = models.DateTimeField(
+        null=True, blank=True, verbose_name='Конец отрисовки'
+    )
+
+    class Meta:
+        ordering = ('created',)
+        verbose_name = 'задание на список покупок'
+        verbose_name_plural = 'Задания на списки покупок'
+
+    def __str__(self):
+        return f'{self.user} shopping list job {self.status}'
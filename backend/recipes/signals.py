@@ -1,11 +1,189 @@
-from django.db.models.signals import pre_delete, m2m_changed, pre_save, post_save
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import (
+    m2m_changed, post_delete, post_save, pre_delete, pre_save,
+)
 from django.dispatch import receiver
 from rest_framework.exceptions import ValidationError
 
-from recipes.models import Recipe
+from api.cache import bump_version
+from api.counters import add_to_counter
+from api.recipe_sets import touch_viewer
+from api.serializers import (
+    refresh_recipe_cards, refresh_recipe_cards_on_commit,
+)
+from api.shopping_items import add_ingredient_rows, add_recipe_amounts
+from api.snapshot import publish_snapshot
+from recipes.models import (
+    Favorite, Ingredient, Recipe, RecipeIngredient, RecipeTag, ShoppingList,
+    Tag, Unit,
+)
+from users.models import Follow, User
 
 
 @receiver(pre_delete, sender=Recipe.ingredients.through)
 def delete_ingredients(sender, instance, **kwargs):
     if instance.recipe.ingredients.count() <= 1:
         raise ValidationError('Нужно добавить ингредиенты')
+
+
+def bump_version_on_commit(name):
+    """Версия сдвигается после фиксации: иначе параллельный запрос
+    успеет собрать снимок новой версии из ещё старых данных."""
+    transaction.on_commit(partial(bump_version, name))
+
+
+def schedule_snapshot():
+    if settings.CATALOG_SNAPSHOT_PATH:
+        transaction.on_commit(publish_snapshot)
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Unit)
+@receiver(post_delete, sender=Unit)
+def ingredients_changed(sender, **kwargs):
+    bump_version_on_commit('ingredients')
+    schedule_snapshot()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    bump_version_on_commit('tags')
+    schedule_snapshot()
+
+
+def refresh_cards_on_commit(recipes):
+    def refresh():
+        recipe_ids = list(recipes.values_list('id', flat=True).distinct())
+        refresh_recipe_cards(Recipe.objects.filter(pk__in=recipe_ids))
+
+    transaction.on_commit(refresh)
+
+
+@receiver(post_save, sender=RecipeTag)
+@receiver(post_delete, sender=RecipeTag)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_rows_changed(sender, instance, **kwargs):
+    # remove() и clear() связей удаляют строки через QuerySet.delete(),
+    # который при подписчиках шлёт post_delete по каждой строке.
+    refresh_recipe_cards_on_commit([instance.recipe_id])
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def recipe_rows_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # add() и set() вставляют строки bulk_create без post_save.
+    if action != 'post_add':
+        return
+    refresh_recipe_cards_on_commit(pk_set if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+def tag_cards(sender, instance, **kwargs):
+    refresh_cards_on_commit(Recipe.objects.filter(tags=instance))
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_cards(sender, instance, **kwargs):
+    refresh_cards_on_commit(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_save, sender=Unit)
+def unit_cards(sender, instance, **kwargs):
+    refresh_cards_on_commit(
+        Recipe.objects.filter(ingredients__measurement_unit=instance)
+    )
+
+
+@receiver(post_save, sender=User)
+def author_cards(sender, instance, created, update_fields=None, **kwargs):
+    if created or (
+        update_fields and set(update_fields) <= {'last_login', 'password'}
+    ):
+        return
+    refresh_cards_on_commit(Recipe.objects.filter(author=instance))
+
+
+@receiver(post_save, sender=ShoppingList)
+def shopping_cart_added(sender, instance, created, **kwargs):
+    if created:
+        add_recipe_amounts(instance.user_id, instance.recipe_id)
+
+
+@receiver(post_delete, sender=ShoppingList)
+def shopping_cart_removed(sender, instance, **kwargs):
+    # При удалении рецепта каскад удаляет и корзины, и RecipeIngredient.
+    # Что бы ни удалилось раньше, каждое количество вычитается один раз:
+    # здесь - оставшиеся у рецепта строки, в ingredient_row_deleted - для
+    # ещё не удалённых корзин.
+    add_recipe_amounts(instance.user_id, instance.recipe_id, sign=-1)
+
+
+def get_ingredient_row(instance):
+    return instance.recipe_id, instance.ingredient_id, instance.amount
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def ingredient_row_saving(sender, instance, **kwargs):
+    instance.previous_row = None
+    if not instance._state.adding:
+        instance.previous_row = RecipeIngredient.objects.filter(
+            pk=instance.pk
+        ).values_list('recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def ingredient_row_saved(sender, instance, **kwargs):
+    if instance.previous_row:
+        add_ingredient_rows([instance.previous_row], sign=-1)
+    add_ingredient_rows([get_ingredient_row(instance)])
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def ingredient_row_deleted(sender, instance, **kwargs):
+    add_ingredient_rows([get_ingredient_row(instance)], sign=-1)
+
+
+@receiver(m2m_changed, sender=Recipe.ingredients.through)
+def ingredient_rows_added(sender, instance, action, reverse, pk_set, **kwargs):
+    # ingredients.add() вставляет строки bulk_create без post_save
+    if action != 'post_add':
+        return
+    rows = RecipeIngredient.objects.filter(
+        **(
+            {'ingredient': instance, 'recipe_id__in': pk_set}
+            if reverse
+            else {'recipe': instance, 'ingredient_id__in': pk_set}
+        )
+    )
+    add_ingredient_rows(
+        rows.values_list('recipe_id', 'ingredient_id', 'amount')
+    )
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+def recipe_counted(sender, instance, created, **kwargs):
+    if created:
+        add_to_counter(sender, instance.recipe_id, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingList)
+def recipe_uncounted(sender, instance, **kwargs):
+    add_to_counter(sender, instance.recipe_id, -1)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingList)
+@receiver(post_delete, sender=ShoppingList)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def viewer_changed(sender, instance, **kwargs):
+    touch_viewer(instance.user_id)
@@ -1,7 +1,229 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as Base64Error
+from collections import OrderedDict
+from math import ceil
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (
+    BasePagination, LimitOffsetPagination, PageNumberPagination,
+)
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.cache import get_version
 
 
 class CustomPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     max_page_size = 24
+
+
+def estimate_count(queryset):
+    """Оценка числа строк планировщиком PostgreSQL (EXPLAIN), без
+    выполнения запроса. Для других СУБД - None."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return int(cursor.fetchone()[0][0]['Plan']['Plan Rows'])
+
+
+def get_cached_count(queryset):
+    """COUNT(*) с кэшированием по сигнатуре запроса (SQL и параметры) на
+    PAGINATION_COUNT_CACHE_TIMEOUT секунд. Если планировщик оценивает
+    выборку выше PAGINATION_ESTIMATE_THRESHOLD строк, вместо точного
+    подсчёта используется оценка. Для заведомо пустой выборки (none(),
+    id__in=[]) SQL не строится и возвращается 0."""
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0
+    key = 'count:' + hashlib.md5(repr((sql, params)).encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = estimate_count(queryset)
+        if count is None or count < settings.PAGINATION_ESTIMATE_THRESHOLD:
+            count = queryset.count()
+        cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class CachedCountPageNumberPagination(CustomPageNumberPagination):
+    """Постраничная выдача с кэшированным (или оценочным) COUNT.
+
+    Страница всегда выбирается как page_size + 1 строк со смещением, без
+    оглядки на count: так видно, есть ли следующая страница, а устаревший
+    или оценочный COUNT не обрезает выдачу. Кэшируется только число в
+    ответе, и оно не меньше того, что видно по самой странице; на
+    последней странице оно точное. С ?count=0 подсчёт не выполняется
+    вовсе, а count в ответе равен null.
+    """
+
+    count_query_param = 'count'
+
+    def get_page_number(self, request, queryset, page_size):
+        value = request.query_params.get(self.page_query_param, 1)
+        if value in self.last_page_strings:
+            return max(ceil(get_cached_count(queryset) / page_size), 1)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.without_count = (
+            request.query_params.get(self.count_query_param) == '0'
+        )
+        page_size = self.get_page_size(request)
+        self.number = self.get_page_number(request, queryset, page_size)
+        if self.number < 1:
+            raise NotFound(self.invalid_page_message)
+        offset = (self.number - 1) * page_size
+        results = list(queryset[offset:offset + page_size + 1])
+        if not results and self.number > 1:
+            raise NotFound(self.invalid_page_message)
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.count = None
+        if not self.without_count:
+            seen = offset + len(results)
+            self.count = (
+                max(get_cached_count(queryset), seen + 1)
+                if self.has_next
+                else seen
+            )
+        return results
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param,
+            self.number + 1,
+        )
+
+    def get_previous_link(self):
+        if self.number == 1:
+            return None
+        if self.number == 2:
+            return remove_query_param(
+                self.request.build_absolute_uri(), self.page_query_param
+            )
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.page_query_param,
+            self.number - 1,
+        )
+
+    def get_paginated_response(self, data):
+        return Response(
+            OrderedDict(
+                (
+                    ('count', self.count),
+                    ('next', self.get_next_link()),
+                    ('previous', self.get_previous_link()),
+                    ('results', data),
+                )
+            )
+        )
+
+
+class IngredientLimitOffsetPagination(LimitOffsetPagination):
+    """limit/offset для полного списка ингредиентов. COUNT кэшируется по
+    версии справочника (api.cache): любое изменение ингредиентов или
+    единиц сдвигает версию, поэтому число не устаревает, а страница
+    выбирается одним запросом."""
+
+    max_limit = 1000
+
+    def get_count(self, queryset):
+        key = f'count:ingredients:{get_version("ingredients")}'
+        count = cache.get(key)
+        if count is None:
+            count = super().get_count(queryset)
+            cache.set(key, count)
+        return count
+
+
+class RecipeCursorPagination(BasePagination):
+    """Keyset-пагинация ленты рецептов по (pub_date, id).
+
+    Следующая страница выбирается условием по последней записи
+    предыдущей, а не OFFSET, поэтому время ответа не растёт с глубиной.
+    Использует индекс recipe_pub_date_id_idx; COUNT не выполняется.
+    """
+
+    cursor_query_param = 'cursor'
+    page_size = CustomPageNumberPagination.page_size
+    page_size_query_param = CustomPageNumberPagination.page_size_query_param
+    max_page_size = CustomPageNumberPagination.max_page_size
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else (
+            self.page_size
+        )
+
+    @staticmethod
+    def encode_cursor(recipe):
+        position = f'{recipe.pub_date.isoformat()}|{recipe.id}'
+        return urlsafe_b64encode(position.encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            pub_date, pk = urlsafe_b64decode(encoded.encode()).decode().split(
+                '|'
+            )
+            position = parse_datetime(pub_date), int(pk)
+        except (Base64Error, UnicodeDecodeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if position[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        queryset = queryset.order_by('-pub_date', '-id')
+        position = self.decode_cursor(request)
+        if position is not None:
+            pub_date, pk = position
+            queryset = queryset.filter(pub_date__lte=pub_date).filter(
+                Q(pub_date__lt=pub_date) | Q(id__lt=pk)
+            )
+        results = list(queryset[:page_size + 1])
+        self.next_recipe = (
+            results[page_size - 1] if len(results) > page_size else None
+        )
+        return results[:page_size]
+
+    def get_next_link(self):
+        if self.next_recipe is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_recipe),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.get_next_link(), 'results': data})
@@ -5,6 +5,7 @@ from drf_extra_fields.fields import LowercaseEmailField
 from rest_framework import serializers
 
 from api.utils import get_recipe_serializer
+from users.models import Follow
 
 User = get_user_model()
 
@@ -25,22 +26,32 @@ class CustomUserCreateSerializer(UserCreateSerializer):
 
 
 class UserBaseSerializer(serializers.BaseSerializer):
-    def to_representation(self, instance):
-        user = self.context['request'].user
-        is_subscribed = (
-            False
-            if user.is_anonymous
-            else instance.following.filter(user_id=user.id).exists()
-        )
+    @staticmethod
+    def get_user_data(instance):
         return {
             'id': instance.id,
             'username': instance.username,
             'first_name': instance.first_name,
             'last_name': instance.last_name,
             'email': instance.email,
-            'is_subscribed': is_subscribed,
         }
 
+    def get_is_subscribed(self, author_id):
+        user = self.context['request'].user
+        following = self.context.get('following')
+        if user.is_anonymous:
+            return False
+        if following is not None:
+            return author_id in following
+        return Follow.objects.filter(
+            user_id=user.id, author_id=author_id
+        ).exists()
+
+    def to_representation(self, instance):
+        data = self.get_user_data(instance)
+        data['is_subscribed'] = self.get_is_subscribed(instance.id)
+        return data
+
 
 class SubscriptionSerializer(UserBaseSerializer):
     def to_representation(self, instance, user=None):
@@ -6,7 +6,7 @@ from rest_framework.generics import get_object_or_404
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 
-from users.pagination import CustomPageNumberPagination
+from users.pagination import CachedCountPageNumberPagination
 from users.serializers import  SubscriptionSerializer
 
 User = get_user_model()
@@ -14,7 +14,7 @@ User = get_user_model()
 
 class CustomUserViewSet(UserViewSet):
     permission_classes = (IsAuthenticated,)
-    pagination_class = CustomPageNumberPagination
+    pagination_class = CachedCountPageNumberPagination
 
 
 @api_view(('POST', 'DELETE'))
@@ -44,7 +44,7 @@ def subscribe(request, pk):
 @api_view(('GET',))
 @permission_classes((IsAuthenticated,))
 def subscriptions(request):
-    paginator = CustomPageNumberPagination()
+    paginator = CachedCountPageNumberPagination()
     queryset = paginator.paginate_queryset(
         User.objects.filter(following__user=request.user), request
     )